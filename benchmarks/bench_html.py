@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare util.strip_tags with the engines of htmlstrip.HTMLStripper.
+
+    python benchmarks/bench_html.py [page_number | directory of crawled .html files]
+"""
+
+import io
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, '.')
+from huoutil.util import strip_tags
+from huoutil.htmlstrip import HTMLStripper, strip_tags_batch
+
+
+def make_page(n_blocks):
+    head = (u'<!DOCTYPE html><html><head><meta charset="utf-8"><title>标题 &amp; 测试</title>'
+            u'<style>body{color:red} a>b{margin:0}</style>'
+            u'<script>var s = "<div>"; if (a < b && c > d) { run(); }</script></head><body>')
+    blocks = []
+    for i in range(n_blocks):
+        blocks.append(u'<div class="item c%d" data-x=\'{"a": 1}\'><a href="/p?id=%d&amp;ref=list">链接%d</a>'
+                      u'<p>这是第%d段文字 &lt;em&gt; &nbsp; some english text %d</p><!-- ad %d --><br/></div>\n' %
+                      (i, i, i, i, random.randint(0, 1000), i))
+    return head + u''.join(blocks) + u'</body></html>'
+
+
+def load_pages(arg):
+    if arg and os.path.isdir(arg):
+        pages = []
+        for name in sorted(os.listdir(arg)):
+            if name.endswith('.html') or name.endswith('.htm'):
+                with io.open(os.path.join(arg, name), encoding='utf-8', errors='replace') as f:
+                    pages.append(f.read())
+        return pages
+    random.seed(0)
+    n = int(arg) if arg else 200
+    return [make_page(random.randint(50, 1000)) for _ in range(n)]
+
+
+def bench(func):
+    t1 = time.time()
+    func()
+    t2 = time.time()
+    return t2 - t1
+
+
+def main():
+    pages = load_pages(sys.argv[1] if len(sys.argv) > 1 else None)
+    mb = sum(len(p.encode('utf-8')) for p in pages) / 1024.0 / 1024.0
+    regex = HTMLStripper()
+    parser = HTMLStripper(engine='parser')
+    cases = [
+        ('util.strip_tags', lambda: [strip_tags(p) for p in pages]),
+        ('parser', lambda: [parser.strip(p) for p in pages]),
+        ('regex', lambda: [regex.strip(p) for p in pages]),
+        ('regex streaming', lambda: [u''.join(regex.iter_strip(p[i:i + 65536] for i in range(0, len(p), 65536)))
+                                     for p in pages]),
+        ('regex batch x4', lambda: list(strip_tags_batch(pages, workers=4, chunk_size=10))),
+    ]
+    print('%d pages, %.1f MB' % (len(pages), mb))
+    for name, func in cases:
+        t = bench(func)
+        print('%-16s %6.2fs %7.1f MB/s %10.0f pages/hour' % (name, t, mb / t, len(pages) / t * 3600))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time and memory allocated per row of iter_by_key in its modes.
+
+    python benchmarks/bench_iter_by_key.py [row_number]
+"""
+
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, '.')
+from huoutil.util import iter_by_key
+
+
+def old_iter_by_key(iterable, key_idx=0, func=None, filter_func=None):
+    # iter_by_key of huoutil 1.3.3
+    info_list = []
+    last_key = None
+    key = None
+    for item in iterable:
+        if func:
+            try:
+                item = func(item)
+            except:
+                continue
+        if filter_func and not filter_func(item):
+            continue
+        try:
+            key = item[key_idx]
+        except IndexError:
+            continue
+        remain = item[:key_idx] + item[key_idx + 1:]
+        if key == last_key:
+            info_list.append(remain)
+        else:
+            if last_key is not None:
+                yield (last_key, info_list)
+            info_list = [remain]
+            last_key = key
+    if info_list:
+        yield (key, info_list)
+
+
+def make_rows(n):
+    return [[u'key%08d' % (i // 10), u'v1', u'v2', u'v3'] for i in range(n)]
+
+
+def bench_time(func, rows):
+    t1 = time.time()
+    for _ in func(rows):
+        pass
+    t2 = time.time()
+    return t2 - t1
+
+
+def bench_memory(func, rows):
+    # the groups are kept, so every object allocated for them is counted
+    tracemalloc.start()
+    groups = list(func(rows))
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del groups
+    return size
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    rows = make_rows(n)
+    cases = [
+        ('old', lambda r: old_iter_by_key(r)),
+        ('key_idx=0', lambda r: iter_by_key(r)),
+        ('raw', lambda r: iter_by_key(r, raw=True)),
+    ]
+    print('%d rows' % n)
+    for name, func in cases:
+        t = bench_time(func, rows)
+        size = bench_memory(func, rows)
+        print('%-10s %6.2fs %8.1f ns/row %8.1f bytes/row' % (name, t, t * 1e9 / n, float(size) / n))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare the "codecs" and "binary" engines of the TSV readers.
+
+    python benchmarks/bench_readers.py [line_number]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+sys.path.insert(0, '.')
+from huoutil.util import file2dict, file2list, iter_file_by_key, file_line_num
+
+
+def make_file(path, n):
+    random.seed(0)
+    with open(path, 'wb') as f:
+        for i in range(n):
+            cols = [u'键%d' % (i // 3), u'值%d' % random.randint(0, 1000)]
+            cols += [u'列%d' % random.randint(0, 1000) for _ in range(6)]
+            f.write((u'\t'.join(cols) + u'\n').encode('utf-8'))
+
+
+def bench(func):
+    t1 = time.time()
+    func()
+    t2 = time.time()
+    return t2 - t1
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    fd, path = tempfile.mkstemp()
+    os.close(fd)
+    try:
+        make_file(path, n)
+        mb = os.path.getsize(path) / 1024.0 / 1024.0
+        cases = [
+            ('file2dict', lambda e: file2dict(path, kn=0, vn=1, engine=e)),
+            ('file2list', lambda e: file2list(path, n=1, engine=e)),
+            ('iter_file_by_key', lambda e: sum(1 for _ in iter_file_by_key(path, engine=e))),
+            ('file_line_num', lambda e: file_line_num(path, engine=e)),
+        ]
+        print('%d lines, %.1f MB' % (n, mb))
+        for name, func in cases:
+            t_codecs = bench(lambda: func('codecs'))
+            t_binary = bench(lambda: func('binary'))
+            print('%-18s codecs %6.2fs %7.1f MB/s | binary %6.2fs %7.1f MB/s | x%.2f' %
+                  (name, t_codecs, mb / t_codecs, t_binary, mb / t_binary, t_codecs / t_binary))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
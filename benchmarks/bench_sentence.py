@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare splite_sentence of huoutil 1.3.3 with the regex based sentence splitters.
+
+    python benchmarks/bench_sentence.py [char_number]
+"""
+
+import io
+import sys
+import time
+import random
+
+sys.path.insert(0, '.')
+from huoutil.util import splite_sentence, iter_sentence_spans, iter_file_sentences
+
+
+def old_splite_sentence(text):
+    long_sep = u'\x03\x04。！？；!?;'
+    short_sep = u'，,:： '
+    long_sents = []
+    offset_begin = 0
+    short_sents = []
+    for i, e in enumerate(text):
+        if e in short_sep:
+            short_sents.append(text[offset_begin:i + 1])
+            offset_begin = i + 1
+        elif e in long_sep:
+            short_sents.append(text[offset_begin:i + 1])
+            long_sents.append(short_sents)
+            short_sents = []
+            offset_begin = i + 1
+    if offset_begin != len(text):
+        short_sents.append(text[offset_begin:])
+    if short_sents:
+        long_sents.append(short_sents)
+    return long_sents
+
+
+def make_text(n):
+    random.seed(0)
+    words = [u'今天', u'天气', u'很好', u'我们', u'去', u'公园', u'散步', u'hello', u'world']
+    parts = []
+    size = 0
+    while size < n:
+        part = u''.join(random.choice(words) for _ in range(random.randint(2, 8)))
+        part += random.choice(u'，，，,：。！？；')
+        parts.append(part)
+        size += len(part)
+    return u''.join(parts)
+
+
+def bench(func):
+    t1 = time.time()
+    func()
+    t2 = time.time()
+    return t2 - t1
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000000
+    text = make_text(n)
+    assert old_splite_sentence(text) == splite_sentence(text)
+    t_old = bench(lambda: old_splite_sentence(text))
+    cases = [
+        ('splite_sentence', lambda: splite_sentence(text)),
+        ('iter_sentence_spans', lambda: sum(1 for _ in iter_sentence_spans(text))),
+        ('iter_file_sentences', lambda: sum(1 for _ in iter_file_sentences(io.StringIO(text)))),
+    ]
+    print('%d chars, old splite_sentence %.2fs' % (len(text), t_old))
+    for name, func in cases:
+        t = bench(func)
+        print('%-20s %6.2fs | x%.2f' % (name, t, t_old / t))
+
+
+if __name__ == '__main__':
+    main()
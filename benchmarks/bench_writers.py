@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time of dict2file against the line by line writer it replaced.
+
+    python benchmarks/bench_writers.py [entry_number]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+import six
+
+sys.path.insert(0, '.')
+from huoutil.compress import open_file
+from huoutil.util import dict2file
+
+
+def old_dict2file(d, path, encoding='utf-8', kfunc=None, vfunc=None, sep='\t'):
+    # dict2file of huoutil 1.3.3, with iteritems replaced to run on python 3
+    with open_file(path, 'w', encoding=encoding) as fo:
+        for key, value in six.iteritems(d):
+            if kfunc is not None:
+                key = kfunc(key)
+            if vfunc is not None:
+                value = vfunc(value)
+            outline = u'{}{}{}\n'.format(key, sep, value)
+            fo.write(outline)
+    return None
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000000
+    d = dict((u'key%09d' % i, i) for i in range(n))
+    path = os.path.join(tempfile.mkdtemp(), 'dict.txt')
+    for name, func in [('old', old_dict2file), ('new', dict2file)]:
+        start = time.time()
+        func(d, path)
+        elapsed = time.time() - start
+        print('%s: %.2fs, %.0f ns/entry' % (name, elapsed, elapsed * 1e9 / n))
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
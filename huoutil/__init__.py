@@ -6,3 +6,10 @@ __author_email__ = 'huohuarong@gmail.com'
 from .util import *
 from .cache import *
 from .uni import *
+from .charclass import *
+from .fingerprint import *
+from .neardup import *
+from .compress import *
+from .htmlstrip import *
+from .mmapdict import *
+from .backend import *
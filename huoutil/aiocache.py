@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+The asyncio version of cache.RedisCache, python 3 only:
+
+    from huoutil.aiocache import AsyncRedisCache
+
+    cache = AsyncRedisCache(max_connections=200)
+    await cache.set_json('k', {'a': 1})
+    await cache.get_json('k')
+"""
+
+from .cache import Codec
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+
+class AsyncRedisCache(object):
+    def __init__(self, host='localhost', port=6379, db=0, password=None, decode_responses=False,
+                 max_connections=None, backend=None):
+        """
+        max_connections: the size of the connection pool. When it is set, the requests beyond it wait
+                         for a free connection instead of failing.
+        backend: None connects to the redis server, or a client object with the redis.asyncio API
+        """
+        self.host = host
+        self.port = port
+        self.db = db
+        if backend is not None:
+            self._pool = None
+            self._cache = backend
+        else:
+            if aioredis is None:
+                raise ImportError('redis.asyncio is required by AsyncRedisCache, please install redis>=4.2')
+            kwargs = dict(host=self.host, port=self.port, db=self.db, password=password,
+                          decode_responses=decode_responses)
+            if max_connections:
+                self._pool = aioredis.BlockingConnectionPool(max_connections=max_connections, **kwargs)
+            else:
+                self._pool = aioredis.ConnectionPool(**kwargs)
+            self._cache = aioredis.StrictRedis(connection_pool=self._pool)
+        self._key_sep = '\x01'
+        self._expire = None
+        self._codec = Codec()
+
+    def set_key_sep(self, sep):
+        self._key_sep = sep
+
+    def set_expire(self, time):
+        self._expire = time
+
+    def set_codec(self, codec):
+        self._codec = codec
+
+    def _wrap_key(self, k):
+        if isinstance(k, (list, tuple)):
+            return self._key_sep.join(k)
+        else:
+            return k
+
+    async def get(self, k):
+        k = self._wrap_key(k)
+        return await self._cache.get(k)
+
+    async def set(self, k, v, ex=None):
+        k = self._wrap_key(k)
+        if ex is None:
+            ex = self._expire
+        return await self._cache.set(k, v, ex=ex)
+
+    async def hset(self, k, n, v, ex=None):
+        """
+        hset and expire are sent in one transaction, see RedisCache.hset
+        """
+        k = self._wrap_key(k)
+        if not ex:
+            return await self._cache.hset(k, n, v), None
+        async with self._cache.pipeline() as pipe:
+            pipe.hset(k, n, v)
+            pipe.expire(k, ex)
+            set_result, ex_result = await pipe.execute()
+        return set_result, ex_result
+
+    async def hget(self, k, n):
+        k = self._wrap_key(k)
+        return await self._cache.hget(k, n)
+
+    async def hset_json(self, k, n, v, ex=None, encoder=None):
+        return await self.hset(k, n, self._codec.dumps_json(v, encoder), ex=ex)
+
+    async def hget_json(self, k, n, decoder=None):
+        return self._codec.loads_json(await self.hget(k, n), decoder)
+
+    async def get_list(self, k, sep='\x01'):
+        v = await self.get(k)
+        if v is None:
+            return None
+        return v.split(sep)
+
+    async def set_list(self, k, v, sep='\x01', ex=None):
+        if v is None:
+            nv = None
+        else:
+            nv = sep.join(v)
+        return await self.set(k, nv, ex=ex)
+
+    async def get_json(self, k, decoder=None):
+        return self._codec.loads_json(await self.get(k), decoder)
+
+    async def set_json(self, k, v, ex=None, encoder=None):
+        return await self.set(k, self._codec.dumps_json(v, encoder), ex=ex)
+
+    async def get_obj(self, k):
+        return self._codec.loads_obj(await self.get(k))
+
+    async def set_obj(self, k, v, ex=None):
+        return await self.set(k, self._codec.dumps_obj(v), ex=ex)
+
+    async def delete(self, *ks):
+        """
+        ks: one or list of keys
+        """
+        ks = [self._wrap_key(k) for k in ks]
+        return await self._cache.delete(*ks)
+
+    async def close(self):
+        """
+        Close the client and disconnect the connection pool.
+        """
+        if hasattr(self._cache, 'aclose'):
+            await self._cache.aclose()
+        else:
+            await self._cache.close()
+        if self._pool is not None:
+            await self._pool.disconnect()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
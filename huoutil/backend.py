@@ -0,0 +1,398 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""
+Local stand-ins of the redis client used by RedisCache, for tests and offline jobs:
+
+    cache = RedisCache(backend='memory')
+    cache = RedisCache(backend='sqlite:////path/to/cache.db')
+
+They implement the subset of redis.StrictRedis that RedisCache needs, with the same
+reply values and TTL semantics. Values are stored as bytes like redis does.
+"""
+
+import time
+import sqlite3
+import threading
+import contextlib
+
+import six
+
+
+class WrongTypeError(Exception):
+    def __init__(self, message='WRONGTYPE Operation against a key holding the wrong kind of value'):
+        self.message = message
+
+    def __str__(self):
+        return repr(self.message)
+
+
+def _encode(v):
+    if isinstance(v, six.binary_type):
+        return v
+    if isinstance(v, six.text_type):
+        return v.encode('utf-8')
+    if isinstance(v, (bool, list, tuple, dict, set)) or v is None:
+        # the same as redis-py, which refuses to guess
+        raise TypeError('Invalid input of type: {0}. Convert to a bytes, string, int or float first.'.format(
+            type(v).__name__))
+    return repr(v).encode('utf-8')
+
+
+class Pipeline(object):
+    """
+    Queue the calls and run them in order on execute, like a redis pipeline.
+    """
+
+    def __init__(self, backend):
+        self._backend = backend
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._backend, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+
+        return queue
+
+    def execute(self):
+        commands, self._commands = self._commands, []
+        with self._backend._atomic():
+            return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+    def reset(self):
+        self._commands = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.reset()
+        return False
+
+
+class LocalBackend(object):
+    """
+    The redis commands on top of a few storage primitives implemented by the subclasses.
+    Expired keys are removed lazily when they are accessed.
+    """
+
+    def __init__(self, decode_responses=False):
+        self.decode_responses = decode_responses
+        self._lock = threading.RLock()
+
+    @contextlib.contextmanager
+    def _atomic(self):
+        """
+        Run the commands of the block as one atomic step. The storage primitives are only called in it.
+        """
+        with self._lock:
+            yield
+
+    # storage primitives
+    def _key_info(self, k):
+        """@return: (type, expire_at) or None"""
+        raise NotImplementedError
+
+    def _get_string(self, k):
+        raise NotImplementedError
+
+    def _set_string(self, k, v, expire_at):
+        raise NotImplementedError
+
+    def _hget(self, k, field):
+        raise NotImplementedError
+
+    def _hgetall(self, k):
+        raise NotImplementedError
+
+    def _hset(self, k, mapping):
+        """@return: the number of new fields"""
+        raise NotImplementedError
+
+    def _set_expire(self, k, expire_at):
+        raise NotImplementedError
+
+    def _delete(self, k):
+        raise NotImplementedError
+
+    def _decode(self, v):
+        if v is not None and self.decode_responses:
+            return v.decode('utf-8')
+        return v
+
+    def _type(self, k):
+        info = self._key_info(k)
+        if info is None:
+            return None
+        typ, expire_at = info
+        if expire_at is not None and expire_at <= time.time():
+            self._delete(k)
+            return None
+        return typ
+
+    def _check_type(self, k, expected):
+        typ = self._type(k)
+        if typ is not None and typ != expected:
+            raise WrongTypeError()
+        return typ
+
+    def get(self, name):
+        k = _encode(name)
+        with self._atomic():
+            if self._check_type(k, 'string') is None:
+                return None
+            return self._decode(self._get_string(k))
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        k = _encode(name)
+        v = _encode(value)
+        if px is not None:
+            ex = px / 1000.0
+        with self._atomic():
+            exists = self._type(k) is not None
+            if (nx and exists) or (xx and not exists):
+                return None
+            if exists:
+                self._delete(k)
+            self._set_string(k, v, time.time() + ex if ex else None)
+        return True
+
+    def mget(self, keys, *args):
+        if isinstance(keys, (six.binary_type, six.text_type)):
+            keys = [keys]
+        keys = list(keys) + list(args)
+        with self._atomic():
+            return [self.get(k) if self._type(_encode(k)) == 'string' else None for k in keys]
+
+    def mset(self, mapping):
+        with self._atomic():
+            for k, v in mapping.items():
+                self.set(k, v)
+        return True
+
+    def hset(self, name, key=None, value=None, mapping=None):
+        k = _encode(name)
+        fields = {}
+        if key is not None:
+            fields[_encode(key)] = _encode(value)
+        if mapping:
+            for n, v in mapping.items():
+                fields[_encode(n)] = _encode(v)
+        with self._atomic():
+            self._check_type(k, 'hash')
+            return self._hset(k, fields)
+
+    def hget(self, name, key):
+        k = _encode(name)
+        with self._atomic():
+            if self._check_type(k, 'hash') is None:
+                return None
+            return self._decode(self._hget(k, _encode(key)))
+
+    def hmget(self, name, keys, *args):
+        if isinstance(keys, (six.binary_type, six.text_type)):
+            keys = [keys]
+        keys = list(keys) + list(args)
+        with self._atomic():
+            return [self.hget(name, n) for n in keys]
+
+    def hgetall(self, name):
+        k = _encode(name)
+        with self._atomic():
+            if self._check_type(k, 'hash') is None:
+                return {}
+            return dict((self._decode(n), self._decode(v)) for n, v in self._hgetall(k).items())
+
+    def expire(self, name, time_):
+        k = _encode(name)
+        with self._atomic():
+            if self._type(k) is None:
+                return False
+            self._set_expire(k, time.time() + time_)
+        return True
+
+    def ttl(self, name):
+        """
+        @return: the remaining seconds, -1 without expire time, -2 if the key does not exist
+        """
+        k = _encode(name)
+        with self._atomic():
+            if self._type(k) is None:
+                return -2
+            expire_at = self._key_info(k)[1]
+        if expire_at is None:
+            return -1
+        return int(round(expire_at - time.time()))
+
+    def exists(self, *names):
+        with self._atomic():
+            return sum(1 for name in names if self._type(_encode(name)) is not None)
+
+    def delete(self, *names):
+        with self._atomic():
+            return sum(1 for name in names if self._type(_encode(name)) is not None and self._delete(_encode(name)))
+
+    def delete_if_equal(self, name, value):
+        """
+        Delete a string key only if it holds value, atomically. RedisCache uses it in place of
+        the compare-and-delete lua script, which the local backends can not run.
+        @return: 1 if the key is deleted, else 0
+        """
+        k = _encode(name)
+        with self._atomic():
+            if self._type(k) != 'string' or self._get_string(k) != _encode(value):
+                return 0
+            self._delete(k)
+        return 1
+
+    def pipeline(self, transaction=True):
+        return Pipeline(self)
+
+
+class MemoryBackend(LocalBackend):
+    """
+    Keep everything in a dict of the process.
+    """
+
+    def __init__(self, decode_responses=False):
+        super(MemoryBackend, self).__init__(decode_responses=decode_responses)
+        # key -> [type, value, expire_at], the value of a hash is a dict
+        self._data = {}
+
+    def _key_info(self, k):
+        entry = self._data.get(k)
+        if entry is None:
+            return None
+        return entry[0], entry[2]
+
+    def _get_string(self, k):
+        return self._data[k][1]
+
+    def _set_string(self, k, v, expire_at):
+        self._data[k] = ['string', v, expire_at]
+
+    def _hget(self, k, field):
+        return self._data[k][1].get(field)
+
+    def _hgetall(self, k):
+        return dict(self._data[k][1])
+
+    def _hset(self, k, mapping):
+        entry = self._data.get(k)
+        if entry is None:
+            entry = self._data[k] = ['hash', {}, None]
+        fields = entry[1]
+        added = sum(1 for n in mapping if n not in fields)
+        fields.update(mapping)
+        return added
+
+    def _set_expire(self, k, expire_at):
+        self._data[k][2] = expire_at
+
+    def _delete(self, k):
+        return self._data.pop(k, None) is not None
+
+
+class SqliteBackend(LocalBackend):
+    """
+    Persist the keys in a sqlite database, which can be shared by the processes of a machine.
+    Every command runs in a write transaction, so e.g. set(nx=True) is atomic between the processes.
+    """
+
+    def __init__(self, path=':memory:', decode_responses=False, timeout=30):
+        super(SqliteBackend, self).__init__(decode_responses=decode_responses)
+        self.path = path
+        self._depth = 0
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        if path != ':memory:':
+            self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS keys '
+                           '(key BLOB PRIMARY KEY, type TEXT NOT NULL, value BLOB, expire_at REAL)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS fields '
+                           '(key BLOB NOT NULL, field BLOB NOT NULL, value BLOB, PRIMARY KEY (key, field))')
+
+    @contextlib.contextmanager
+    def _atomic(self):
+        # the lock only guards the threads of this connection, the other processes are kept out
+        # by a write transaction, so a check and the write after it can not interleave with them
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            self._conn.execute('BEGIN IMMEDIATE')
+            self._depth = 1
+            try:
+                yield
+            except BaseException:
+                self._depth = 0
+                self._conn.execute('ROLLBACK')
+                raise
+            self._depth = 0
+            self._conn.execute('COMMIT')
+
+    def _key_info(self, k):
+        row = self._conn.execute('SELECT type, expire_at FROM keys WHERE key = ?', (k, )).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1]
+
+    def _get_string(self, k):
+        row = self._conn.execute('SELECT value FROM keys WHERE key = ?', (k, )).fetchone()
+        return six.binary_type(row[0])
+
+    def _set_string(self, k, v, expire_at):
+        self._conn.execute('INSERT OR REPLACE INTO keys (key, type, value, expire_at) VALUES (?, ?, ?, ?)',
+                           (k, 'string', v, expire_at))
+
+    def _hget(self, k, field):
+        row = self._conn.execute('SELECT value FROM fields WHERE key = ? AND field = ?', (k, field)).fetchone()
+        if row is None:
+            return None
+        return six.binary_type(row[0])
+
+    def _hgetall(self, k):
+        rows = self._conn.execute('SELECT field, value FROM fields WHERE key = ?', (k, )).fetchall()
+        return dict((six.binary_type(n), six.binary_type(v)) for n, v in rows)
+
+    def _hset(self, k, mapping):
+        self._conn.execute('INSERT OR IGNORE INTO keys (key, type) VALUES (?, ?)', (k, 'hash'))
+        added = 0
+        for n, v in mapping.items():
+            cur = self._conn.execute('UPDATE fields SET value = ? WHERE key = ? AND field = ?', (v, k, n))
+            if cur.rowcount == 0:
+                self._conn.execute('INSERT INTO fields (key, field, value) VALUES (?, ?, ?)', (k, n, v))
+                added += 1
+        return added
+
+    def _set_expire(self, k, expire_at):
+        self._conn.execute('UPDATE keys SET expire_at = ? WHERE key = ?', (expire_at, k))
+
+    def _delete(self, k):
+        cur = self._conn.execute('DELETE FROM keys WHERE key = ?', (k, ))
+        self._conn.execute('DELETE FROM fields WHERE key = ?', (k, ))
+        return cur.rowcount > 0
+
+    def close(self):
+        self._conn.close()
+
+
+def make_backend(url, decode_responses=False):
+    """
+    Create a local backend from a config string.
+    @param url: "memory", "sqlite://" (in memory), or a sqlite path in the SQLAlchemy style:
+                "sqlite:///relative/cache.db" and "sqlite:////absolute/cache.db"
+    """
+    if url == 'memory':
+        return MemoryBackend(decode_responses=decode_responses)
+    if url.startswith('sqlite://'):
+        path = url[len('sqlite://'):]
+        if path.startswith('/'):
+            path = path[1:]
+        return SqliteBackend(path or ':memory:', decode_responses=decode_responses)
+    raise ValueError('invalid backend: {0}. Please use "redis", "memory" or "sqlite:///path"'.format(url))
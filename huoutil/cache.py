@@ -1,7 +1,14 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import copy
 import json
+import time
+import uuid
+import functools
+import threading
+import contextlib
+from collections import OrderedDict
 import six
 
 if six.PY2:
@@ -14,15 +21,224 @@ try:
 except ImportError:
     pass
 
+from .backend import make_backend
+
+
+try:
+    import zlib
+except ImportError:
+    zlib = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# header bytes of the encoded values, json text and pickle never begin with them
+HEADER_ZLIB = b'\x01'
+HEADER_LZ4 = b'\x02'
+HEADER_MSGPACK = b'\x03'
+
+
+class Codec(object):
+    """
+    Serialize the values of RedisCache. The default codec writes the same values as before:
+    stdlib json with ensure_ascii=False and pickle protocol 2.
+    Values written by any codec can be read by any other one, because the compressed and msgpack values
+    begin with a header byte. Compression and msgpack need decode_responses=False.
+    @param json_backend: "json", "orjson", "msgpack", or "auto" which is orjson if installed, else json.
+                         A custom encoder or decoder always falls back to stdlib json.
+    @param pickle_protocol: the pickle protocol of set_obj, e.g. pickle.HIGHEST_PROTOCOL
+    @param compress: None, "zlib" or "lz4"
+    @param compress_threshold: only the values longer than it are compressed
+    @param compress_level: the compression level of zlib
+    """
+
+    def __init__(self, json_backend='json', pickle_protocol=2, compress=None, compress_threshold=1024,
+                 compress_level=1):
+        if json_backend == 'auto':
+            json_backend = 'orjson' if orjson is not None else 'json'
+        if json_backend not in ('json', 'orjson', 'msgpack'):
+            raise ValueError('invalid json backend: {0}'.format(json_backend))
+        if json_backend == 'orjson' and orjson is None:
+            raise ImportError('orjson is not installed')
+        if json_backend == 'msgpack' and msgpack is None:
+            raise ImportError('msgpack is not installed')
+        if compress not in (None, 'zlib', 'lz4'):
+            raise ValueError('invalid compress: {0}'.format(compress))
+        if compress == 'lz4' and lz4 is None:
+            raise ImportError('lz4 is not installed')
+        self.json_backend = json_backend
+        self.pickle_protocol = pickle_protocol
+        self.compress = compress
+        self.compress_threshold = compress_threshold
+        self.compress_level = compress_level
+
+    def _compress(self, s):
+        if self.compress is None or len(s) <= self.compress_threshold:
+            return s
+        if isinstance(s, six.text_type):
+            s = s.encode('utf-8')
+        if self.compress == 'zlib':
+            return HEADER_ZLIB + zlib.compress(s, self.compress_level)
+        return HEADER_LZ4 + lz4.frame.compress(s)
+
+    def _decompress(self, s):
+        if not isinstance(s, six.binary_type):
+            return s
+        header = s[:1]
+        if header == HEADER_ZLIB:
+            return zlib.decompress(s[1:])
+        if header == HEADER_LZ4:
+            if lz4 is None:
+                raise ImportError('lz4 is not installed')
+            return lz4.frame.decompress(s[1:])
+        return s
+
+    def dumps_json(self, v, encoder=None):
+        if v is None:
+            return None
+        if encoder is None and self.json_backend == 'msgpack':
+            s = HEADER_MSGPACK + msgpack.packb(v, use_bin_type=True)
+        elif encoder is None and self.json_backend == 'orjson':
+            try:
+                s = orjson.dumps(v, option=orjson.OPT_NON_STR_KEYS)
+            except TypeError:
+                # e.g. integers beyond 64 bits
+                s = json.dumps(v, ensure_ascii=False)
+        else:
+            s = json.dumps(v, ensure_ascii=False, cls=encoder)
+        return self._compress(s)
+
+    def loads_json(self, s, decoder=None):
+        if s is None:
+            return None
+        s = self._decompress(s)
+        if isinstance(s, six.binary_type) and s[:1] == HEADER_MSGPACK:
+            if msgpack is None:
+                raise ImportError('msgpack is not installed')
+            return msgpack.unpackb(s[1:], raw=False, strict_map_key=False)
+        if decoder is None and self.json_backend == 'orjson':
+            try:
+                return orjson.loads(s)
+            except ValueError:
+                pass
+        return json.loads(s, cls=decoder)
+
+    def dumps_obj(self, v):
+        if v is None:
+            return None
+        return self._compress(pickle.dumps(v, protocol=self.pickle_protocol))
+
+    def loads_obj(self, s):
+        if s is None:
+            return None
+        return pickle.loads(self._decompress(s))
+
+
+_MISS = object()
+
+# delete the lock only if it still holds our token, in one step on the server
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LRUCache(object):
+    """
+    A thread safe, size bounded LRU cache whose entries expire after ttl seconds.
+    """
+
+    def __init__(self, maxsize=10000, ttl=None):
+        if ttl is not None and ttl <= 0:
+            raise ValueError('invalid ttl: {0}. Please use a positive number or None'.format(ttl))
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, k, default=None):
+        with self._lock:
+            entry = self._data.pop(k, _MISS)
+            if entry is not _MISS and (entry[1] is None or entry[1] > time.time()):
+                self._data[k] = entry
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+            return default
+
+    def set(self, k, v, ttl=None):
+        """
+        ttl: expire seconds of the entry, it can not exceed the ttl of the cache.
+             An entry with ttl <= 0 is already expired, so it is not stored.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        elif self.ttl is not None:
+            ttl = min(ttl, self.ttl)
+        with self._lock:
+            self._data.pop(k, None)
+            if ttl is not None and ttl <= 0:
+                return
+            self._data[k] = (v, None if ttl is None else time.time() + ttl)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, k):
+        with self._lock:
+            return self._data.pop(k, _MISS) is not _MISS
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._data)}
+
+    def __len__(self):
+        return len(self._data)
+
 
 class RedisCache(object):
-    def __init__(self, host='localhost', port=6379, db=0, password=None, decode_responses=False):
+    def __init__(self, host='localhost', port=6379, db=0, password=None, decode_responses=False, backend=None):
+        """
+        backend: None or "redis" connects to the redis server.
+                 "memory" or "sqlite:///path" uses a local stand-in, see backend.make_backend.
+                 It can also be a client object with the redis API.
+        """
         self.host = host
         self.port = port
         self.db = db
-        self._cache = redis.StrictRedis(host=self.host, port=self.port, db=self.db, password=password, decode_responses=decode_responses)
+        if backend is None or backend == 'redis':
+            self._cache = redis.StrictRedis(host=self.host, port=self.port, db=self.db, password=password, decode_responses=decode_responses)
+        elif isinstance(backend, six.string_types):
+            self._cache = make_backend(backend, decode_responses=decode_responses)
+        else:
+            self._cache = backend
         self._key_sep = '\x01'
         self._expire = None
+        # (reply function, command number) of the queued calls in batch mode
+        self._pending = None
+        self.results = None
+        self._local = None
+        self._local_kinds = set()
+        self._codec = Codec()
+        self._release_script = None
 
     def set_key_sep(self, sep):
         self._key_sep = sep
@@ -30,6 +246,72 @@ class RedisCache(object):
     def set_expire(self, time):
         self._expire = time
 
+    def set_codec(self, codec):
+        """
+        codec: a Codec which serializes the values of the json and obj methods
+        """
+        self._codec = codec
+
+    def set_local_cache(self, maxsize=10000, ttl=60):
+        """
+        Put an in-process LRU cache in front of redis for get, get_list, get_json and get_obj.
+        The decoded values are cached, so the callers should not modify them.
+        set_json and set_obj write through, the other setters and delete invalidate the local entry
+        once the write is done (after execute in batch mode).
+        The local entries expire after min(ttl, set_expire time) seconds. The remaining TTL of the key in redis
+        is not read, and the writes of other processes are not seen, so ttl bounds how stale a value can be.
+        maxsize=0 disables the local cache.
+        """
+        if maxsize:
+            self._local = LRUCache(maxsize=maxsize, ttl=ttl)
+        else:
+            self._local = None
+        self._local_kinds = set()
+
+    def local_stats(self):
+        """
+        @return: a dict of hits, misses and size of the local cache, or None if it is disabled
+        """
+        if self._local is None:
+            return None
+        return self._local.stats()
+
+    def _local_get(self, kind, k):
+        # the replies of batch mode are not ready, so it always reads through
+        if self._local is None or self._pending is not None:
+            return _MISS
+        return self._local.get((kind, k), _MISS)
+
+    def _local_fill(self, kind, k, v, ex=None):
+        if self._local is not None and self._pending is None and v is not None:
+            if ex is None:
+                ex = self._expire
+            self._local_kinds.add(kind)
+            self._local.set((kind, k), v, ttl=ex)
+        return v
+
+    def _local_delete(self, *ks):
+        if self._local is None:
+            return
+        for k in ks:
+            for kind in list(self._local_kinds):
+                self._local.delete((kind, k))
+
+    def _written(self, ks, func=None, kind=None, value=None, ex=None):
+        """
+        The reply function of a write: invalidate the local entries of ks after the write is done,
+        so that a read in between can not put the old value back. A write through caches value for ks[0].
+        """
+        def reply(r):
+            if self._local is not None:
+                self._local_delete(*ks)
+                if kind is not None:
+                    self._local_kinds.add(kind)
+                    self._local.set((kind, ks[0]), value, ttl=ex)
+            return r if func is None else func(r)
+
+        return reply
+
     def _wrap_key(
             self,
             k,
@@ -39,53 +321,101 @@ class RedisCache(object):
         else:
             return k
 
+    def _reply(self, func, reply):
+        """
+        Post-process the reply of one command.
+        In batch mode the reply is not ready, so the function is queued and None is returned.
+        """
+        if self._pending is not None:
+            self._pending.append((func, 1))
+            return None
+        if func is None:
+            return reply
+        return func(reply)
+
+    def _multi(self, commands, func):
+        """
+        Run several commands in one round-trip.
+        @param commands: a list of (method name, args, kwargs) of the redis client
+        @param func: a function applied to the list of the replies
+        """
+        pipe = self._cache if self._pending is not None else self._cache.pipeline()
+        for name, args, kwargs in commands:
+            getattr(pipe, name)(*args, **kwargs)
+        if self._pending is not None:
+            self._pending.append((lambda *replies: func(list(replies)), len(commands)))
+            return None
+        return func(pipe.execute())
+
+    @contextlib.contextmanager
+    def batch(self, transaction=False):
+        """
+        Buffer the calls into one redis pipeline, which is executed when the block exits.
+        The methods of the yielded cache return None, their results are in its results list afterwards:
+            with cache.batch() as b:
+                b.set_json('a', {'x': 1})
+                b.get('b')
+            b.results  # [True, 'value of b']
+        """
+        b = copy.copy(self)
+        b._cache = self._cache.pipeline(transaction=transaction)
+        b._pending = []
+        b.results = []
+        try:
+            yield b
+            replies = b._cache.execute()
+            i = 0
+            for func, n in b._pending:
+                args = replies[i:i + n]
+                i += n
+                b.results.append(args[0] if func is None else func(*args))
+        finally:
+            b._cache.reset()
+            b._pending = None
+
     def get(self, k):
         k = self._wrap_key(k)
-        return self._cache.get(k)
+        v = self._local_get('raw', k)
+        if v is not _MISS:
+            return v
+        return self._reply(lambda v: self._local_fill('raw', k, v), self._cache.get(k))
 
     def set(self, k, v, ex=None):
         k = self._wrap_key(k)
         if ex is None:
             ex = self._expire
-        return self._cache.set(k, v, ex=ex)
+        return self._reply(self._written([k]), self._cache.set(k, v, ex=ex))
 
     def hset(self, k, n, v, ex=None):
         """hset操作
         因为redis过期时间只支持顶层key,且hset没有过期时间设置原子化操作，所以自己加入expire操作
+        hset和expire在同一个pipeline中发送，只有一次网络往返
         """
         k = self._wrap_key(k)
-        set_result = self._cache.hset(k, n, v)
-        if ex:
-            ex_result = self._cache.expire(k, ex)
-        else:
-            ex_result = None
-        return set_result, ex_result
+        if not ex:
+            return self._reply(lambda r: (r, None), self._cache.hset(k, n, v))
+        return self._multi([('hset', (k, n, v), {}), ('expire', (k, ex), {})], tuple)
 
     def hget(self, k, n):
         k = self._wrap_key(k)
-        return self._cache.hget(k, n)
+        return self._reply(None, self._cache.hget(k, n))
 
     def hset_json(self, k, n, v, ex=None, encoder=None):
         k = self._wrap_key(k)
-        if v is None:
-            nv = None
-        else:
-            nv = json.dumps(v, ensure_ascii=False, cls=encoder)
-        return self.hset(k, n, nv, ex=ex)
+        return self.hset(k, n, self._codec.dumps_json(v, encoder), ex=ex)
 
     def hget_json(self, k, n, decoder=None):
-        jsn_str = self.hget(k, n)
-        if jsn_str is None:
-            return None
-        else:
-            return json.loads(jsn_str, cls=decoder)
+        k = self._wrap_key(k)
+        return self._reply(lambda s: self._codec.loads_json(s, decoder), self._cache.hget(k, n))
 
     def get_list(self, k, sep='\x01'):
         k = self._wrap_key(k)
-        v = self._cache.get(k)
-        if v is None:
-            return None
-        return v.split(sep)
+        kind = ('list', sep)
+        v = self._local_get(kind, k)
+        if v is not _MISS:
+            return v
+        return self._reply(lambda v: self._local_fill(kind, k, None if v is None else v.split(sep)),
+                           self._cache.get(k))
 
     def set_list(self, k, v, sep='\x01', ex=None):
         k = self._wrap_key(k)
@@ -95,46 +425,217 @@ class RedisCache(object):
             nv = sep.join(v)
         if ex is None:
             ex = self._expire
-        return self._cache.set(k, nv, ex=ex)
+        return self._reply(self._written([k]), self._cache.set(k, nv, ex=ex))
 
     def get_json(self, k, decoder=None):
         k = self._wrap_key(k)
-        jsn_str = self._cache.get(k)
-        if jsn_str is None:
-            return None
-        else:
-            return json.loads(jsn_str, cls=decoder)
+        kind = ('json', decoder)
+        v = self._local_get(kind, k)
+        if v is not _MISS:
+            return v
+        return self._reply(lambda s: self._local_fill(kind, k, self._codec.loads_json(s, decoder)),
+                           self._cache.get(k))
 
     def set_json(self, k, v, ex=None, encoder=None):
         k = self._wrap_key(k)
-        if v is None:
-            nv = None
-        else:
-            nv = json.dumps(v, ensure_ascii=False, cls=encoder)
         if ex is None:
             ex = self._expire
-        return self._cache.set(k, nv, ex=ex)
+        nv = self._codec.dumps_json(v, encoder)
+        if self._local is None or nv is None:
+            return self._reply(self._written([k]), self._cache.set(k, nv, ex=ex))
+        # cache what get_json would return, e.g. tuples become lists
+        written = self._written([k], kind=('json', None), value=self._codec.loads_json(nv), ex=ex)
+        return self._reply(written, self._cache.set(k, nv, ex=ex))
 
     def get_obj(self, k):
         k = self._wrap_key(k)
-        s = self._cache.get(k)
-        if s is None:
-            return None
-        else:
-            return pickle.loads(s)
+        v = self._local_get('obj', k)
+        if v is not _MISS:
+            return v
+        return self._reply(lambda s: self._local_fill('obj', k, self._codec.loads_obj(s)), self._cache.get(k))
 
     def set_obj(self, k, v, ex=None):
         k = self._wrap_key(k)
-        if v is None:
-            nv = None
-        else:
-            nv = pickle.dumps(v, protocol=2)
         if ex is None:
             ex = self._expire
-        return self._cache.set(k, nv, ex=ex)
+        nv = self._codec.dumps_obj(v)
+        if self._local is None or nv is None:
+            return self._reply(self._written([k]), self._cache.set(k, nv, ex=ex))
+        written = self._written([k], kind='obj', value=self._codec.loads_obj(nv), ex=ex)
+        return self._reply(written, self._cache.set(k, nv, ex=ex))
 
     def delete(self, *ks):
         """
         ks: one or list of keys
         """
-        return self._cache.delete(*ks)
+        ks = [self._wrap_key(k) for k in ks]
+        return self._reply(self._written(ks), self._cache.delete(*ks))
+
+    def mget(self, ks, func=None):
+        """
+        Get many keys in one round-trip.
+        @param ks: a list of keys
+        @param func: a function applied to each value
+        @return: a list of values, None for the missing keys
+        """
+        ks = [self._wrap_key(k) for k in ks]
+        if func is None:
+            func = lambda v: v
+        if not ks:
+            return self._multi([], lambda replies: [])
+        return self._reply(lambda vs: [func(v) for v in vs], self._cache.mget(ks))
+
+    def mset(self, mapping, ex=None, func=None):
+        """
+        Set many keys in one round-trip.
+        @param mapping: a dict or a list of (key, value)
+        @param ex: expire seconds, default is set_expire
+        @param func: a function applied to each value
+        @return: True if all the keys are set
+        """
+        items = list(mapping.items()) if isinstance(mapping, dict) else list(mapping)
+        if func is None:
+            func = lambda v: v
+        if ex is None:
+            ex = self._expire
+        written = self._written([self._wrap_key(k) for k, _ in items], func=all)
+        if ex:
+            commands = [('set', (self._wrap_key(k), func(v)), {'ex': ex}) for k, v in items]
+        else:
+            pairs = dict((self._wrap_key(k), func(v)) for k, v in items)
+            commands = [('mset', (pairs, ), {})] if pairs else []
+        return self._multi(commands, written)
+
+    def hmget(self, k, ns, func=None):
+        """
+        Get many fields of a hash in one round-trip.
+        @return: a list of values, None for the missing fields
+        """
+        k = self._wrap_key(k)
+        if func is None:
+            func = lambda v: v
+        if not ns:
+            return self._multi([], lambda replies: [])
+        return self._reply(lambda vs: [func(v) for v in vs], self._cache.hmget(k, ns))
+
+    def hmset(self, k, mapping, ex=None, func=None):
+        """
+        Set many fields of a hash and its expire time in one round-trip.
+        @param mapping: a dict of field and value
+        @param ex: expire seconds of the hash
+        @param func: a function applied to each value
+        @return: (number of new fields, expire result)
+        """
+        k = self._wrap_key(k)
+        if func is None:
+            func = lambda v: v
+        commands = []
+        if mapping:
+            fields = dict((n, func(v)) for n, v in mapping.items())
+            commands.append(('hset', (k, ), {'mapping': fields}))
+        if ex:
+            commands.append(('expire', (k, ex), {}))
+        return self._multi(
+            commands, lambda replies: (replies[0] if mapping else 0, replies[-1] if ex else None))
+
+    def mget_json(self, ks, decoder=None):
+        return self.mget(ks, func=lambda s: self._codec.loads_json(s, decoder))
+
+    def mset_json(self, mapping, ex=None, encoder=None):
+        return self.mset(mapping, ex=ex, func=lambda v: self._codec.dumps_json(v, encoder))
+
+    def mget_obj(self, ks):
+        return self.mget(ks, func=self._codec.loads_obj)
+
+    def mset_obj(self, mapping, ex=None):
+        return self.mset(mapping, ex=ex, func=self._codec.dumps_obj)
+
+    def hmget_json(self, k, ns, decoder=None):
+        return self.hmget(k, ns, func=lambda s: self._codec.loads_json(s, decoder))
+
+    def hmset_json(self, k, mapping, ex=None, encoder=None):
+        return self.hmset(k, mapping, ex=ex, func=lambda v: self._codec.dumps_json(v, encoder))
+
+    def _release_lock(self, lock_key, token):
+        """
+        Delete lock_key if it still holds token. A lock which expired and was taken by another worker
+        is not ours to delete, so the compare and the delete must be atomic.
+        """
+        delete_if_equal = getattr(self._cache, 'delete_if_equal', None)
+        if delete_if_equal is not None:
+            # the local backends
+            return delete_if_equal(lock_key, token)
+        if self._release_script is None:
+            self._release_script = self._cache.register_script(RELEASE_LOCK_SCRIPT)
+        return self._release_script(keys=[lock_key], args=[token])
+
+    def cached(self, prefix=None, ex=None, typ='json', lock_timeout=30, wait_timeout=None, poll_interval=0.05):
+        """
+        Memoize a function in the cache:
+            @cache.cached(ex=3600)
+            def expensive(query, topn=10):
+                ...
+        The key is wrapped from the prefix and the repr of the arguments.
+        On a miss only the worker holding a short lock key computes the value, the others poll the cache
+        until the value appears or wait_timeout passes, then they compute it themselves.
+        The wrapped function has cache_key(*args, **kwargs) and invalidate(*args, **kwargs).
+        @param prefix: the first part of the key, default is the module and name of the function
+        @param ex: expire seconds of the value, default is set_expire
+        @param typ: "json" stores by set_json, "obj" stores by set_obj
+        @param lock_timeout: expire seconds of the lock, it should be longer than one computation
+        @param wait_timeout: seconds to wait for the lock holder, default is lock_timeout
+        @param poll_interval: seconds between two polls
+        """
+        if typ == 'json':
+            getter, setter = self.get_json, self.set_json
+        elif typ == 'obj':
+            getter, setter = self.get_obj, self.set_obj
+        else:
+            raise ValueError('invalid cached type: {0}. Please use "json" or "obj"'.format(typ))
+        if wait_timeout is None:
+            wait_timeout = lock_timeout
+
+        def decorator(func):
+            key_prefix = prefix or '{0}.{1}'.format(func.__module__, getattr(func, '__qualname__', func.__name__))
+
+            def cache_key(*args, **kwargs):
+                parts = [key_prefix] + [repr(a) for a in args]
+                parts += ['{0}={1!r}'.format(k, kwargs[k]) for k in sorted(kwargs)]
+                return self._wrap_key(parts)
+
+            def compute_and_set(key, args, kwargs):
+                value = func(*args, **kwargs)
+                # the value is wrapped in a list, so that a cached None differs from a miss
+                setter(key, [value], ex=ex)
+                return value
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                key = cache_key(*args, **kwargs)
+                found = getter(key)
+                if found is not None:
+                    return found[0]
+                lock_key = self._wrap_key([key, 'lock'])
+                token = uuid.uuid4().hex
+                if self._cache.set(lock_key, token, nx=True, ex=lock_timeout):
+                    try:
+                        # the previous holder may have stored the value between our miss and the lock
+                        found = getter(key)
+                        if found is not None:
+                            return found[0]
+                        return compute_and_set(key, args, kwargs)
+                    finally:
+                        self._release_lock(lock_key, token)
+                deadline = time.time() + wait_timeout
+                while time.time() < deadline:
+                    time.sleep(poll_interval)
+                    found = getter(key)
+                    if found is not None:
+                        return found[0]
+                return compute_and_set(key, args, kwargs)
+
+            wrapper.cache_key = cache_key
+            wrapper.invalidate = lambda *args, **kwargs: self.delete(cache_key(*args, **kwargs))
+            return wrapper
+
+        return decorator
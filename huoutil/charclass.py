@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Fast ASCII / Chinese classification of strings, without a python loop per character.
+
+The single-string checks use str.isascii (constant time on CPython 3.7+) or a compiled
+regex. The batch versions classify a whole corpus at once, and can return a numpy bool
+mask to index arrays or DataFrames:
+
+    mask = ascii_mask(lines, as_numpy=True)
+    english = np.asarray(lines, dtype=object)[mask]
+"""
+
+import re
+
+import six
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+NON_ASCII_PATTERN = re.compile(u'[^\x00-\x7f]+')
+# CJK Unified Ideographs, Extension A and Compatibility Ideographs
+CHINESE_PATTERN = re.compile(u'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+NON_CHINESE_PATTERN = re.compile(u'[^\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]')
+
+
+def _is_ascii_fallback(s):
+    # python < 3.7 has no str.isascii
+    try:
+        if isinstance(s, six.text_type):
+            s.encode('ascii')
+        else:
+            s.decode('ascii')
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return False
+    return True
+
+
+if hasattr(str, 'isascii'):
+
+    def is_ascii(s):
+        """
+        Whether all the characters (or bytes) of s are ASCII. The empty string is ASCII.
+        @param s: a unicode or bytes string
+        """
+        return s.isascii()
+else:
+    is_ascii = _is_ascii_fallback
+
+
+def ascii_chars(s):
+    """
+    Remove the non-ASCII characters of s.
+    """
+    if is_ascii(s):
+        return s
+    return NON_ASCII_PATTERN.sub(u'', s)
+
+
+def has_chinese(s):
+    """
+    Whether s contains a chinese character.
+    """
+    return CHINESE_PATTERN.search(s) is not None
+
+
+def is_all_chinese(s):
+    """
+    Whether s is non-empty and made of chinese characters only.
+    """
+    return bool(s) and NON_CHINESE_PATTERN.search(s) is None
+
+
+def _mask(pred, strings, as_numpy):
+    if as_numpy:
+        if np is None:
+            raise ImportError('numpy is required when as_numpy=True')
+        return np.fromiter(map(pred, strings), dtype=bool)
+    return list(map(pred, strings))
+
+
+def ascii_mask(strings, as_numpy=False):
+    """
+    Classify many strings at once.
+    @param strings: an iterable of strings
+    @param as_numpy: return a numpy bool array instead of a list
+    @return: is_ascii of each string
+    """
+    return _mask(is_ascii, strings, as_numpy)
+
+
+def chinese_mask(strings, as_numpy=False):
+    """
+    @return: has_chinese of each string, see ascii_mask
+    """
+    return _mask(has_chinese, strings, as_numpy)
+
+
+def all_chinese_mask(strings, as_numpy=False):
+    """
+    @return: is_all_chinese of each string, see ascii_mask
+    """
+    return _mask(is_all_chinese, strings, as_numpy)
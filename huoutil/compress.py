@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Open plain and compressed files the same way. The readers and writers of util use it,
+so .gz, .bz2, .xz and .zst files can be read and written without staging a decompressed copy:
+
+    d = file2dict('dict.txt.gz')
+    with open_file('log.zst', encoding='utf-8') as f:
+        for line in f:
+            ...
+
+When reading, the format is detected by the magic bytes, and the decompression runs in
+a background thread so that it overlaps with the parsing. When writing, the format is
+chosen by the file extension. zstd requires the zstandard package.
+"""
+
+import io
+import os
+import re
+import bz2
+import gzip
+import atexit
+import codecs
+import weakref
+import threading
+
+from six.moves import queue
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# "BZh" alone is plain text, so the bz2 magic includes the block size and the magic of
+# the first block, or of the end of the stream for an empty file
+MAGICS = [
+    ('gzip', re.compile(re.escape(b'\x1f\x8b\x08'))),
+    ('bz2', re.compile(b'BZh[1-9](?:1AY&SY|\x17rE8P\x90)')),
+    ('xz', re.compile(re.escape(b'\xfd7zXZ\x00'))),
+    ('zstd', re.compile(re.escape(b'\x28\xb5\x2f\xfd'))),
+]
+EXTENSIONS = {
+    '.gz': 'gzip',
+    '.bz2': 'bz2',
+    '.xz': 'xz',
+    '.zst': 'zstd',
+}
+
+
+def detect_compression(path):
+    """
+    @return: "gzip", "bz2", "xz", "zstd" or None for a plain file
+    """
+    with open(path, 'rb') as f:
+        head = f.read(10)
+    for name, magic in MAGICS:
+        if magic.match(head):
+            return name
+    return None
+
+
+def _open_compressed(path, mode, compression, level=None):
+    # mode is "rb" or "wb"
+    if compression == 'gzip':
+        return gzip.open(path, mode, compresslevel=level or 6)
+    if compression == 'bz2':
+        return bz2.BZ2File(path, mode, compresslevel=level or 9)
+    if compression == 'xz':
+        if lzma is None:
+            raise ImportError('lzma is required to open {0}'.format(path))
+        return lzma.open(path, mode, preset=level)
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError('zstandard is required to open {0}'.format(path))
+        if mode == 'rb':
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return zstandard.ZstdCompressor(level=level or 3).stream_writer(open(path, 'wb'), closefd=True)
+    raise ValueError('invalid compression: {0}. Please use "gzip", "bz2", "xz" or "zstd"'.format(compression))
+
+
+def _main_thread_alive():
+    main = getattr(threading, 'main_thread', None)
+    return main is None or main().is_alive()
+
+
+def _read_blocks(f, blocks, stop, block_size):
+    # the worker holds no reference to its reader, so an unclosed reader can still be collected and closed
+    def put(item):
+        # the main thread is stopped when the interpreter exits, do not block the shutdown
+        while not stop.is_set() and _main_thread_alive():
+            try:
+                blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        while True:
+            data = f.read(block_size)
+            if not put(data) or not data:
+                break
+    except Exception as e:
+        put(e)
+
+
+_READERS = weakref.WeakSet()
+
+
+@atexit.register
+def _close_readers():
+    for reader in list(_READERS):
+        reader.close()
+
+
+class ThreadedReader(io.RawIOBase):
+    """
+    Read a binary stream by blocks in a background thread.
+    zlib, bz2, lzma and zstandard release the GIL while decompressing, so it runs in parallel with the reader.
+    The thread is stopped by close, and at exit for the readers never closed.
+    At most queue_size blocks are read ahead, 1 MB by default.
+    """
+
+    def __init__(self, f, block_size=256 * 1024, queue_size=4):
+        self._f = f
+        self._queue = queue.Queue(queue_size)
+        self._stop = threading.Event()
+        self._eof = False
+        self._block = b''
+        self._pos = 0
+        self._thread = threading.Thread(target=_read_blocks, args=(f, self._queue, self._stop, block_size))
+        self._thread.start()
+        _READERS.add(self)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        if self._pos >= len(self._block):
+            if self._eof:
+                return 0
+            item = self._queue.get()
+            if isinstance(item, Exception):
+                self._eof = True
+                raise item
+            if not item:
+                self._eof = True
+                return 0
+            self._block = item
+            self._pos = 0
+        n = min(len(b), len(self._block) - self._pos)
+        b[:n] = self._block[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._stop.set()
+            self._thread.join()
+            self._f.close()
+            _READERS.discard(self)
+        super(ThreadedReader, self).close()
+
+
+def open_file(path, mode='r', encoding='utf-8', compression='auto', threaded=True, level=None):
+    """
+    Open a plain or compressed file.
+    @param path: the file path
+    @param mode: "r" and "w" read and write unicode like codecs.open, "rb" and "wb" read and write bytes
+    @param encoding: the encoding of the text modes
+    @param compression: "auto" detects it by the magic bytes when reading and by the extension when writing,
+                        None for a plain file, or one of "gzip", "bz2", "xz" and "zstd"
+    @param threaded: decompress in a background thread
+    @param level: the compression level when writing, the default of each format if None
+    @return: a file object
+    """
+    if mode not in ('r', 'rb', 'w', 'wb'):
+        raise ValueError('invalid mode: {0}. Please use "r", "rb", "w" or "wb"'.format(mode))
+    reading = mode.startswith('r')
+    if compression == 'auto':
+        if reading:
+            compression = detect_compression(path)
+        else:
+            compression = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if compression is None:
+        if mode in ('rb', 'wb'):
+            return open(path, mode)
+        return codecs.open(path, mode + 'b', encoding=encoding)
+    f = _open_compressed(path, 'rb' if reading else 'wb', compression, level)
+    if reading:
+        if threaded:
+            f = io.BufferedReader(ThreadedReader(f))
+        if mode == 'r':
+            f = codecs.getreader(encoding)(f)
+    elif mode == 'w':
+        f = codecs.getwriter(encoding)(f)
+    return f
+
+
+def is_compressed(path):
+    """
+    Whether the file is compressed, in which case it can not be split into byte ranges.
+    """
+    return detect_compression(path) is not None
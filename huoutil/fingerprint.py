@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+64-bit fingerprints of strings, lines and files, for dedup of large corpora.
+
+A fingerprint is an unsigned 64-bit int instead of a 32-char md5 hex string,
+and the batch functions can return a numpy uint64 array:
+
+    fps = fingerprints(lines, as_numpy=True)
+    fps = column_fingerprints('data.tsv', n=0, workers=8)
+    digests = file_digests(paths, workers=8)
+
+The text is hashed as utf-8, so the fingerprint of a line read from a file
+equals the fingerprint of the same unicode string.
+Algorithms: "blake2b" (the default), "md5" (the first 8 bytes of the md5 digest),
+and "xxh64" / "xxh3" which are much faster and require the xxhash package.
+"""
+
+import struct
+import logging
+import hashlib
+import functools
+from multiprocessing.pool import ThreadPool
+
+import six
+
+from .util import parallel_parse, iter_binary_lines
+from .compress import open_file
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+_UNPACK_Q = struct.Struct('<Q').unpack
+
+
+def _blake2b(b):
+    return _UNPACK_Q(hashlib.blake2b(b, digest_size=8).digest())[0]
+
+
+def _md5(b):
+    return _UNPACK_Q(hashlib.md5(b).digest()[:8])[0]
+
+
+def _hasher(algorithm):
+    if algorithm == 'blake2b':
+        return _blake2b
+    if algorithm == 'md5':
+        return _md5
+    if algorithm in ('xxh64', 'xxh3'):
+        if xxhash is None:
+            raise ImportError('xxhash is required by the algorithm {0}'.format(algorithm))
+        return xxhash.xxh64_intdigest if algorithm == 'xxh64' else xxhash.xxh3_64_intdigest
+    raise ValueError('invalid algorithm: {0}. Please use "blake2b", "md5", "xxh64" or "xxh3"'.format(algorithm))
+
+
+def _to_bytes(s):
+    if isinstance(s, six.text_type):
+        return s.encode('utf-8')
+    return s
+
+
+def fingerprint(s, algorithm='blake2b'):
+    """
+    @param s: a unicode or utf-8 bytes string
+    @return: the unsigned 64-bit fingerprint
+    """
+    return _hasher(algorithm)(_to_bytes(s))
+
+
+def _pack(values, as_numpy):
+    if as_numpy:
+        if np is None:
+            raise ImportError('numpy is required when as_numpy=True')
+        return np.fromiter(values, dtype=np.uint64)
+    return list(values)
+
+
+def fingerprints(strings, algorithm='blake2b', as_numpy=False):
+    """
+    Fingerprint many strings.
+    @param strings: an iterable of unicode or utf-8 bytes strings
+    @param as_numpy: return a numpy uint64 array instead of a list of ints
+    """
+    hasher = _hasher(algorithm)
+    return _pack((hasher(_to_bytes(s)) for s in strings), as_numpy)
+
+
+def _bin_lines2fingerprints(lines, n=None, sep='\t', encoding='utf-8', algorithm='blake2b', skip_line=0):
+    hasher = _hasher(algorithm)
+    bsep = sep.encode(encoding)
+    utf8 = encoding.lower().replace('_', '-') in ('utf-8', 'utf8')
+    fps = []
+    line_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        line_number += 1
+        if line_number <= skip_line:
+            continue
+        value = line.rstrip(b'\n\r ')
+        if n is not None:
+            try:
+                value = value.split(bsep)[n]
+            except IndexError:
+                logging.exception('invalid line: %s' % line.decode(encoding, 'replace'))
+                continue
+        if not utf8:
+            value = value.decode(encoding).encode('utf-8')
+        fps.append(hasher(value))
+    return fps
+
+
+def column_fingerprints(path, n=None, sep='\t', encoding='utf-8', algorithm='blake2b', skip_line=0, workers=None,
+                        as_numpy=False):
+    """
+    Fingerprint a column of each line of a file. Lines are read like file2list: blank lines are
+    skipped, the line is right stripped, and the lines without the column are skipped.
+    @param path: input file path
+    @param n: the column number, None means the whole line
+    @param sep: the field seperator
+    @param encoding: the input encoding, must be ASCII compatible when workers > 1
+    @param algorithm: see fingerprint
+    @param skip_line: skip lines number
+    @param workers: hash in a process pool of this size. Hashing short strings holds the GIL,
+                    so processes are used here rather than threads.
+    @param as_numpy: return a numpy uint64 array instead of a list of ints
+    @return: the fingerprints in file order
+    """
+    _hasher(algorithm)
+    parser = functools.partial(_bin_lines2fingerprints, n=n, sep=sep, encoding=encoding, algorithm=algorithm)
+    if workers and workers > 1:
+        parts = parallel_parse(path, parser, workers, encoding=encoding, skip_line=skip_line, binary=True)
+        values = (fp for part in parts for fp in part)
+    else:
+        with open_file(path, 'rb') as f:
+            values = parser(iter_binary_lines(f), skip_line=skip_line)
+    return _pack(values, as_numpy)
+
+
+def file_digest(path, algorithm='md5', buffer_size=1024 * 1024):
+    """
+    The hex digest of a whole file.
+    @param algorithm: any algorithm of hashlib
+    """
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        while True:
+            buf = f.read(buffer_size)
+            if not buf:
+                break
+            h.update(buf)
+    return h.hexdigest()
+
+
+def file_digests(paths, algorithm='md5', workers=4, buffer_size=1024 * 1024):
+    """
+    The hex digests of many files, computed in a thread pool.
+    hashlib releases the GIL while hashing large buffers, so the threads run in parallel.
+    @return: the digests in the order of paths
+    """
+    func = functools.partial(file_digest, algorithm=algorithm, buffer_size=buffer_size)
+    paths = list(paths)
+    if not workers or workers <= 1 or len(paths) <= 1:
+        return [func(p) for p in paths]
+    pool = ThreadPool(min(workers, len(paths)))
+    try:
+        return pool.map(func, paths)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Strip the tags of HTML pages, reusing one engine for many documents:
+
+    stripper = HTMLStripper()
+    text = stripper.strip(page)
+
+    # streaming, the text is returned as soon as it is complete
+    for chunk in chunks:
+        out.write(stripper.feed(chunk))
+    out.write(stripper.close())
+
+    # many pages in a process pool
+    for text in strip_tags_batch(pages, workers=8):
+        ...
+
+Two engines are available. "regex" removes tags, comments and script/style blocks
+with one compiled regex and is about 5 times faster. "parser" uses HTMLParser and
+follows the HTML tokenizing rules exactly, e.g. for a "<" inside a script.
+Entities are unescaped after the tags are removed, so "&lt;b&gt;" is kept as "<b>".
+"""
+
+import re
+import itertools
+
+import six
+
+from .util import _imap_worker
+
+if six.PY2:
+    from HTMLParser import HTMLParser
+    unescape = HTMLParser().unescape
+else:
+    from html import unescape
+    from html.parser import HTMLParser
+
+_RAW_TEXT = r'<(?P<raw>script|style)\b[^>]*>.*?(?P<raw_end></(?P=raw)\s*>|\Z)'
+_COMMENT = r'<!--.*?(?P<comment_end>-->|\Z)'
+_TAG = r'''<[a-zA-Z/!?](?:[^>"']|"[^"]*"|'[^']*')*>'''
+STRIP_PATTERN = re.compile('|'.join([_RAW_TEXT, _COMMENT, _TAG]), re.S | re.I)
+# script and style are kept as text, only their tags are removed
+STRIP_KEEP_RAW_PATTERN = re.compile('|'.join([_COMMENT, _TAG]), re.S | re.I)
+# the longest entity is shorter than this, e.g. "&CounterClockwiseContourIntegral;"
+_MAX_ENTITY_LEN = 40
+_TAG_CANDIDATE = re.compile(r'<(?:[a-zA-Z/!?]|\Z)')
+
+
+def _unterminated(m):
+    groups = m.groupdict()
+    if groups.get('raw'):
+        return not groups['raw_end']
+    return m.group(0).startswith('<!--') and not groups['comment_end']
+
+
+class _TextParser(HTMLParser):
+    def __init__(self, drop_script_style):
+        if six.PY2:
+            HTMLParser.__init__(self)
+        else:
+            HTMLParser.__init__(self, convert_charrefs=True)
+        self.drop_script_style = drop_script_style
+        self.fed = []
+        self.raw_depth = 0
+
+    def reset(self):
+        HTMLParser.reset(self)
+        self.fed = []
+        self.raw_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.drop_script_style and tag in ('script', 'style'):
+            self.raw_depth += 1
+
+    def handle_endtag(self, tag):
+        if self.drop_script_style and tag in ('script', 'style') and self.raw_depth:
+            self.raw_depth -= 1
+
+    def handle_data(self, d):
+        if not self.raw_depth:
+            self.fed.append(d)
+
+    if six.PY2:
+
+        def handle_entityref(self, name):
+            self.handle_data(unescape(u'&%s;' % name))
+
+        def handle_charref(self, name):
+            self.handle_data(unescape(u'&#%s;' % name))
+
+    def pop_data(self):
+        data = u''.join(self.fed)
+        self.fed = []
+        return data
+
+
+class HTMLStripper(object):
+    """
+    A reusable tag stripping engine. It is not thread safe, use one per thread.
+    """
+
+    def __init__(self, drop_script_style=True, engine='regex'):
+        """
+        @param drop_script_style: remove the content of script and style elements too
+        @param engine: "regex" or "parser"
+        """
+        if engine not in ('regex', 'parser'):
+            raise ValueError('invalid engine: {0}. Please use "regex" or "parser"'.format(engine))
+        self.drop_script_style = drop_script_style
+        self.engine = engine
+        self._pattern = STRIP_PATTERN if drop_script_style else STRIP_KEEP_RAW_PATTERN
+        self._parser = _TextParser(drop_script_style) if engine == 'parser' else None
+        self._buf = u''
+        # the held text starts with a tag, script, style or comment which needs a ">" to end
+        self._blocked = False
+        # the chunks fed while blocked, not scanned yet
+        self._held = []
+
+    def strip(self, html):
+        """
+        @return: the text of a whole document
+        """
+        if self._parser is not None:
+            self._parser.reset()
+            self._parser.feed(html)
+            return self.close()
+        self._buf = html
+        self._blocked = False
+        self._held = []
+        return self._flush(True)
+
+    def feed(self, chunk):
+        """
+        Feed the next chunk of a document.
+        @return: the text which is complete so far, the rest is kept until the next feed or close
+        """
+        if self._parser is not None:
+            self._parser.feed(chunk)
+            return self._parser.pop_data()
+        if self._blocked:
+            # nothing can be complete before the held tag ends, do not scan it again
+            self._held.append(chunk)
+            if u'>' not in chunk:
+                return u''
+            chunk = u''.join(self._held)
+            self._held = []
+        self._buf += chunk
+        return self._flush(False)
+
+    def close(self):
+        """
+        End the document and reset the stripper for the next one.
+        @return: the remaining text
+        """
+        if self._parser is not None:
+            self._parser.close()
+            data = self._parser.pop_data()
+            self._parser.reset()
+            return data
+        return self._flush(True)
+
+    def iter_strip(self, chunks):
+        """
+        Strip a document given by chunks, e.g. iter(functools.partial(f.read, 65536), u'').
+        @return: a generator of text pieces
+        """
+        for chunk in chunks:
+            data = self.feed(chunk)
+            if data:
+                yield data
+        data = self.close()
+        if data:
+            yield data
+
+    def _flush(self, final):
+        if self._held:
+            self._buf += u''.join(self._held)
+            self._held = []
+        buf = self._buf
+        pieces = []
+        pos = 0
+        cut = len(buf)
+        blocked = False
+        for m in itertools.chain(self._pattern.finditer(buf), [None]):
+            end = len(buf) if m is None else m.start()
+            if not final:
+                # a tag which does not match yet may be completed by the next chunk
+                candidate = _TAG_CANDIDATE.search(buf, pos, end)
+                if candidate is not None:
+                    cut = candidate.start()
+                    blocked = candidate.end() > cut + 1
+                    break
+                if m is not None and m.end() == len(buf) and _unterminated(m):
+                    # an unterminated script, style or comment may end in the next chunk
+                    cut = m.start()
+                    blocked = True
+                    break
+            if m is None:
+                break
+            pieces.append(buf[pos:m.start()])
+            pos = m.end()
+        if not final and not blocked:
+            # an incomplete entity at the end
+            amp = buf.rfind(u'&', max(pos, cut - _MAX_ENTITY_LEN), cut)
+            if amp >= 0 and u';' not in buf[amp:cut]:
+                cut = amp
+        pieces.append(buf[pos:cut])
+        self._buf = buf[cut:]
+        self._blocked = blocked
+        # the text between two tags is unescaped alone, an entity can not span a tag
+        return u''.join([unescape(p) if u'&' in p else p for p in pieces])
+
+
+def strip_tags_batch(htmls, workers=None, chunk_size=100, drop_script_style=True, engine='regex'):
+    """
+    Strip many documents with one stripper per process.
+    @param htmls: an iterable of html strings
+    @param workers: the process number, None or 1 means in the current process
+    @param chunk_size: the number of documents sent to a process at once
+    @return: a generator of the texts in the input order
+    """
+    options = dict(drop_script_style=drop_script_style, engine=engine)
+    # not a generator itself, so that invalid options raise at call time
+    HTMLStripper(**options)
+    return _imap_worker(HTMLStripper, options, htmls, method='strip', workers=workers, chunk_size=chunk_size)
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+A read-only dict served from an on-disk hash index through mmap.
+
+The index is built once from the same arguments as util.file2dict, and then
+every process opening it shares the page-cached copy:
+
+    d = MmapDict('big_dict.txt', kn=0, vn=1)
+    d.get(u'key')
+"""
+
+import os
+import mmap
+import struct
+import hashlib
+import logging
+import tempfile
+import contextlib
+from array import array
+
+import six
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .compress import open_file
+
+INDEX_MAGIC = b'HUOIDX01'
+# magic, source size, source mtime, params digest, slot number, entry number
+_HEADER = struct.Struct('<8sQd16sQQ')
+_SLOT = struct.Struct('<QQ')
+_RECORD = struct.Struct('<II')
+
+
+def _key_hash(kb):
+    # never 0, because 0 marks an empty slot
+    return struct.unpack('<Q', hashlib.md5(kb).digest()[:8])[0] | 1
+
+
+def _func_name(func):
+    # lambdas and closures of the same name can not be told apart, pass rebuild=True when they change
+    if func is None:
+        return u''
+    name = getattr(func, '__qualname__', None) or getattr(func, '__name__', None) or type(func).__name__
+    return u'{}.{}'.format(getattr(func, '__module__', None) or u'', name)
+
+
+def _params_digest(kn, vn, sep, encoding, ktype, skip_line):
+    s = u'{}\x01{}\x01{}\x01{}\x01{}\x01{}'.format(kn, vn, sep, encoding, _func_name(ktype), skip_line)
+    return hashlib.md5(s.encode('utf-8')).digest()
+
+
+def _iter_records(path, kn, vn, sep, encoding, ktype, skip_line):
+    line_number = 0
+    with open_file(path, encoding=encoding) as fp:
+        for line in fp:
+            if not line.strip():
+                continue
+            line_number += 1
+            if line_number <= skip_line:
+                continue
+            tokens = line.rstrip('\n\r ').split(sep)
+            try:
+                key = tokens[kn]
+                if ktype:
+                    key = ktype(key)
+                if vn is None:
+                    # every column is prefixed by sep, so that [] and [u''] stay distinct
+                    value = u''.join(sep + t for t in tokens[:kn] + tokens[kn + 1:])
+                else:
+                    value = tokens[vn]
+            except IndexError:
+                logging.exception('invalid line: %s' % line)
+                continue
+            yield six.text_type(key).encode('utf-8'), value.encode('utf-8')
+
+
+def build_mmap_index(path, index_path=None, kn=0, vn=1, sep='\t', encoding='utf-8', ktype=None, skip_line=0):
+    """
+    Build the on-disk hash index of a file, parsed the same way as file2dict.
+    The index is written to a temp file and moved to index_path, so concurrent readers never see a partial index.
+    @param path: input file path
+    @param index_path: output index path, default is path + '.idx'
+    @param kn: the column number of key
+    @param vn: the column number of value, None means all the columns except the key
+    @param sep: the field seperator
+    @param encoding: the input encoding
+    @param ktype: custom a function applied to the key of each line
+    @param skip_line: skip lines number
+    @return: the index path
+    """
+    if index_path is None:
+        index_path = path + '.idx'
+    stat = os.stat(path)
+    index_dir = os.path.dirname(os.path.abspath(index_path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.huoidx.', dir=index_dir)
+    try:
+        with os.fdopen(fd, 'w+b') as fo:
+            # records go to a scratch file first, the slot number is unknown until the end
+            hashes = array('Q')
+            offsets = array('Q')
+            with tempfile.TemporaryFile() as data:
+                pos = 0
+                for kb, vb in _iter_records(path, kn, vn, sep, encoding, ktype, skip_line):
+                    data.write(_RECORD.pack(len(kb), len(vb)))
+                    data.write(kb)
+                    data.write(vb)
+                    hashes.append(_key_hash(kb))
+                    offsets.append(pos)
+                    pos += _RECORD.size + len(kb) + len(vb)
+
+                n_slots = 8
+                while n_slots < len(hashes) * 2:
+                    n_slots *= 2
+                data_offset = _HEADER.size + n_slots * _SLOT.size
+                table = bytearray(n_slots * _SLOT.size)
+                data.flush()
+                view = mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) if pos else b''
+                n_entries = 0
+                mask = n_slots - 1
+                for h, off in zip(hashes, offsets):
+                    klen = _RECORD.unpack_from(view, off)[0]
+                    kb = view[off + _RECORD.size:off + _RECORD.size + klen]
+                    i = h & mask
+                    while True:
+                        sh, soff = _SLOT.unpack_from(table, i * _SLOT.size)
+                        if sh == 0:
+                            n_entries += 1
+                            break
+                        if sh == h:
+                            # same key appears again: the last one wins, like file2dict
+                            old = soff - data_offset
+                            old_klen = _RECORD.unpack_from(view, old)[0]
+                            if view[old + _RECORD.size:old + _RECORD.size + old_klen] == kb:
+                                break
+                        i = (i + 1) & mask
+                    _SLOT.pack_into(table, i * _SLOT.size, h, data_offset + off)
+                if pos:
+                    view.close()
+
+                digest = _params_digest(kn, vn, sep, encoding, ktype, skip_line)
+                fo.write(_HEADER.pack(INDEX_MAGIC, stat.st_size, stat.st_mtime, digest, n_slots, n_entries))
+                fo.write(table)
+                data.seek(0)
+                while True:
+                    buf = data.read(1 << 20)
+                    if not buf:
+                        break
+                    fo.write(buf)
+        os.replace(tmp_path, index_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return index_path
+
+
+@contextlib.contextmanager
+def _index_lock(index_path):
+    # without fcntl, e.g. on Windows, the processes may build the same index at the same time
+    if fcntl is None:
+        yield
+        return
+    with open(index_path + '.lock', 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class MmapDict(object):
+    """
+    Read-only mapping over an index built by build_mmap_index.
+    The parameters are the same as file2dict. The index is (re)built when it is missing,
+    when the source file changed or when it was built with other parameters, ktype included.
+    Keys are compared by their text form after ktype, so ktype should give the same
+    result when applied to its own output (e.g. int, float, str.lower).
+    """
+
+    def __init__(self, path, kn=0, vn=1, sep='\t', encoding='utf-8', ktype=None, vtype=None, skip_line=0,
+                 index_path=None, rebuild=False):
+        self.path = path
+        self.index_path = index_path or path + '.idx'
+        self.sep = sep
+        self.vn = vn
+        self.ktype = ktype
+        self.vtype = vtype
+        if rebuild or not self._is_fresh(kn, vn, sep, encoding, ktype, skip_line):
+            with _index_lock(self.index_path):
+                # another process may have built it while this one was waiting for the lock
+                if rebuild or not self._is_fresh(kn, vn, sep, encoding, ktype, skip_line):
+                    build_mmap_index(path, self.index_path, kn=kn, vn=vn, sep=sep, encoding=encoding, ktype=ktype,
+                                     skip_line=skip_line)
+        with open(self.index_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _, _, _, _, self._n_slots, self._n_entries = _HEADER.unpack_from(self._mm, 0)
+        self._mask = self._n_slots - 1
+
+    def _is_fresh(self, kn, vn, sep, encoding, ktype, skip_line):
+        if not os.path.exists(self.index_path):
+            return False
+        stat = os.stat(self.path)
+        with open(self.index_path, 'rb') as f:
+            head = f.read(_HEADER.size)
+        if len(head) < _HEADER.size:
+            return False
+        magic, size, mtime, digest, _, _ = _HEADER.unpack(head)
+        return (magic == INDEX_MAGIC and size == stat.st_size and mtime == stat.st_mtime
+                and digest == _params_digest(kn, vn, sep, encoding, ktype, skip_line))
+
+    def _find(self, key):
+        kb = six.text_type(key).encode('utf-8')
+        h = _key_hash(kb)
+        i = h & self._mask
+        mm = self._mm
+        while True:
+            sh, off = _SLOT.unpack_from(mm, _HEADER.size + i * _SLOT.size)
+            if sh == 0:
+                return None
+            if sh == h:
+                klen, vlen = _RECORD.unpack_from(mm, off)
+                kbegin = off + _RECORD.size
+                if mm[kbegin:kbegin + klen] == kb:
+                    return kbegin + klen, vlen
+            i = (i + 1) & self._mask
+
+    def _value(self, begin, length):
+        value = self._mm[begin:begin + length].decode('utf-8')
+        if self.vn is None:
+            value = value.split(self.sep)[1:]
+        if self.vtype:
+            value = self.vtype(value)
+        return value
+
+    def _key(self, kb):
+        key = kb.decode('utf-8')
+        if self.ktype:
+            key = self.ktype(key)
+        return key
+
+    def __getitem__(self, key):
+        found = self._find(key)
+        if found is None:
+            raise KeyError(key)
+        return self._value(*found)
+
+    def get(self, key, default=None):
+        found = self._find(key)
+        if found is None:
+            return default
+        return self._value(*found)
+
+    def __contains__(self, key):
+        return self._find(key) is not None
+
+    def __len__(self):
+        return self._n_entries
+
+    def _iter_entries(self):
+        mm = self._mm
+        off = _HEADER.size + self._n_slots * _SLOT.size
+        end = len(mm)
+        while off < end:
+            klen, vlen = _RECORD.unpack_from(mm, off)
+            kbegin = off + _RECORD.size
+            kb = mm[kbegin:kbegin + klen]
+            # skip records overwritten by a later line with the same key
+            found = self._find(kb.decode('utf-8'))
+            if found is not None and found[0] == kbegin + klen:
+                yield kb, kbegin + klen, vlen
+            off = kbegin + klen + vlen
+
+    def __iter__(self):
+        for kb, _, _ in self._iter_entries():
+            yield self._key(kb)
+
+    def keys(self):
+        return iter(self)
+
+    def values(self):
+        for _, begin, length in self._iter_entries():
+            yield self._value(begin, length)
+
+    def items(self):
+        for kb, begin, length in self._iter_entries():
+            yield self._key(kb), self._value(begin, length)
+
+    def close(self):
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
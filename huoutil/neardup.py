@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Near-duplicate detection with MinHash and LSH (locality sensitive hashing).
+
+Texts are compared by the Jaccard similarity of their char n-grams, so no word
+segmentation is needed for chinese. Normalize the texts first to ignore the width,
+punctuation and case differences:
+
+    index = MinHashIndex(threshold=0.8, normalize=Normalizer(upper=1))
+    for i, line in enumerate(lines):
+        if index.add_if_new(i, line) is None:
+            fo.write(line)
+
+A lookup only compares the signatures in the buckets shared with the query,
+so its cost does not grow with the size of the index.
+"""
+
+import zlib
+import random
+from array import array
+
+import six
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_MASK64 = (1 << 64) - 1
+
+
+def _integrate(f, a, b, steps=100):
+    step = (b - a) / float(steps)
+    return sum(f(a + (i + 0.5) * step) for i in range(steps)) * step
+
+
+def _optimal_bands(threshold, num_perm):
+    """
+    Choose bands * rows == num_perm which minimizes the sum of the false positive probability
+    below threshold and the false negative probability above it.
+    """
+    best = None
+    for bands in range(1, num_perm + 1):
+        if num_perm % bands:
+            continue
+        rows = num_perm // bands
+        fp = _integrate(lambda s: 1 - (1 - s**rows)**bands, 0.0, threshold)
+        fn = _integrate(lambda s: (1 - s**rows)**bands, threshold, 1.0)
+        if best is None or fp + fn < best[0]:
+            best = (fp + fn, bands)
+    return best[1]
+
+
+def shingles(text, ngram=3):
+    """
+    The set of char n-grams of text. A text shorter than ngram is a single shingle.
+    """
+    if len(text) <= ngram:
+        return set([text]) if text else set()
+    return set(text[i:i + ngram] for i in range(len(text) - ngram + 1))
+
+
+class MinHashIndex(object):
+    """
+    An in-memory LSH index of MinHash signatures, supporting incremental insert and query.
+    """
+
+    def __init__(self, threshold=0.8, num_perm=128, bands=None, ngram=3, normalize=None, seed=1):
+        """
+        @param threshold: the Jaccard similarity above which two texts are near-duplicates
+        @param num_perm: the signature length, more is more accurate and slower
+        @param bands: the band number of LSH, it must divide num_perm. Default is chosen from threshold.
+        @param ngram: the shingle length in chars
+        @param normalize: a function applied to the texts first, e.g. standard_string_format or a Normalizer
+        @param seed: the seed of the hash functions, indexes to compare must use the same one
+        """
+        if not 0 < threshold <= 1:
+            raise ValueError('invalid threshold: {0}. Please use a value in (0, 1]'.format(threshold))
+        if bands is None:
+            bands = _optimal_bands(threshold, num_perm)
+        if num_perm % bands:
+            raise ValueError('invalid bands: {0}. It must divide num_perm {1}'.format(bands, num_perm))
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.ngram = ngram
+        self.normalize = normalize
+        rnd = random.Random(seed)
+        # multiply-shift hashing: the high 32 bits of (a * x + b) mod 2 ** 64, a is odd
+        self._a = [rnd.getrandbits(64) | 1 for _ in range(num_perm)]
+        self._b = [rnd.getrandbits(64) for _ in range(num_perm)]
+        if np is not None:
+            self._np_a = np.array(self._a, dtype=np.uint64)[:, None]
+            self._np_b = np.array(self._b, dtype=np.uint64)[:, None]
+        self._signatures = {}
+        self._buckets = [{} for _ in range(bands)]
+
+    def signature(self, text):
+        """
+        @return: the MinHash signature of text, a list of num_perm 32-bit ints
+        """
+        if self.normalize is not None:
+            text = self.normalize(text)
+        hashes = [zlib.crc32(s.encode('utf-8')) & 0xffffffff for s in shingles(text, self.ngram)]
+        if not hashes:
+            return [0xffffffff] * self.num_perm
+        if np is not None and len(hashes) > 4:
+            x = np.array(hashes, dtype=np.uint64)[None, :]
+            return ((self._np_a * x + self._np_b) >> np.uint64(32)).min(axis=1).tolist()
+        return [min(((a * x + b) & _MASK64) >> 32 for x in hashes) for a, b in zip(self._a, self._b)]
+
+    def _band_keys(self, sig):
+        r = self.rows
+        return [hash(tuple(sig[i * r:(i + 1) * r])) for i in range(self.bands)]
+
+    def similarity(self, sig1, sig2):
+        """
+        @return: the Jaccard similarity estimated from two signatures
+        """
+        return sum(1 for x, y in zip(sig1, sig2) if x == y) / float(self.num_perm)
+
+    def _candidates(self, band_keys):
+        seen = set()
+        for bucket, band_key in zip(self._buckets, band_keys):
+            for key in bucket.get(band_key, ()):
+                if key not in seen:
+                    seen.add(key)
+                    yield key
+
+    def _query(self, sig, band_keys, threshold, first):
+        result = []
+        for key in self._candidates(band_keys):
+            sim = self.similarity(sig, self._signatures[key])
+            if sim >= threshold:
+                if first:
+                    return [(key, sim)]
+                result.append((key, sim))
+        result.sort(key=lambda e: -e[1])
+        return result
+
+    def _insert(self, key, sig, band_keys):
+        if key in self._signatures:
+            raise ValueError('duplicated key: {0}'.format(key))
+        self._signatures[key] = array('L', sig)
+        for bucket, band_key in zip(self._buckets, band_keys):
+            keys = bucket.get(band_key)
+            if keys is None:
+                bucket[band_key] = [key]
+            else:
+                keys.append(key)
+
+    def insert(self, key, text):
+        """
+        Add a text to the index.
+        @param key: a hashable id of the text, unique in the index
+        """
+        sig = self.signature(text)
+        self._insert(key, sig, self._band_keys(sig))
+
+    def query(self, text, threshold=None):
+        """
+        Find the near-duplicates of text in the index.
+        @param threshold: the minimum estimated similarity, default is the threshold of the index
+        @return: a list of (key, estimated similarity), the most similar first
+        """
+        sig = self.signature(text)
+        return self._query(sig, self._band_keys(sig), threshold or self.threshold, False)
+
+    def add_if_new(self, key, text):
+        """
+        Insert text unless it is a near-duplicate of a text in the index, for one-pass dedup.
+        The signature is computed only once.
+        @return: the key of a near-duplicate found, or None when text is inserted
+        """
+        sig = self.signature(text)
+        band_keys = self._band_keys(sig)
+        found = self._query(sig, band_keys, self.threshold, True)
+        if found:
+            return found[0][0]
+        self._insert(key, sig, band_keys)
+        return None
+
+    def __contains__(self, key):
+        return key in self._signatures
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def keys(self):
+        return six.iterkeys(self._signatures)
@@ -1,11 +1,20 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import re
+import io
 import string
 import hashlib
 
+from .charclass import is_ascii, ascii_chars
+from .compress import open_file
+from .util import _imap_worker
+
 CHINESE_PUNCTUATION = u'，。！￥？——；“”：《》（）'
 ENGLISH_PUNCTUATION = string.punctuation
+SPACE_PATTERN = re.compile(r'\s')
+# 连续的标点一次删除, 比逐字符的str.translate快
+CHINESE_PUNCTUATION_PATTERN = re.compile(u'[%s]+' % re.escape(CHINESE_PUNCTUATION))
+ENGLISH_PUNCTUATION_PATTERN = re.compile(u'[%s]+' % re.escape(ENGLISH_PUNCTUATION))
 
 
 def is_chinese_punctuation(char):
@@ -13,11 +22,7 @@ def is_chinese_punctuation(char):
 
 
 def remove_chinese_punctuation(s):
-    ret = u''
-    for c in s:
-        if not is_chinese_punctuation(c):
-            ret += c
-    return ret
+    return CHINESE_PUNCTUATION_PATTERN.sub(u'', s)
 
 
 def is_english_punctuation(char):
@@ -25,27 +30,15 @@ def is_english_punctuation(char):
 
 
 def remove_english_punctuation(s):
-    ret = u''
-    for c in s:
-        if not is_english_punctuation(c):
-            ret += c
-    return ret
+    return ENGLISH_PUNCTUATION_PATTERN.sub(u'', s)
 
 
 def is_pure_english(s):
-    yes = True
-    for e in s:
-        if ord(e) > 127:
-            yes = False
-            break
-    if yes:
-        return True
-    else:
-        return False
+    return is_ascii(s)
 
 
 def english_words(s):
-    return ''.join([e for e in s if ord(e) <= 127]).strip()
+    return ascii_chars(s).strip()
 
 
 def common_suffix(s1, s2):
@@ -80,22 +73,72 @@ def test():
             print(e.encode('utf-8'))
 
 
+# 全角转半角的映射: 全角空格U+3000转成空格, U+FF01~U+FF5E转成U+0021~U+007E
+DBC2SBC_MAP = dict((c, chr(c - 0xfee0)) for c in range(0xff01, 0xff5f))
+DBC2SBC_MAP[0x3000] = ' '
+DBC2SBC_PATTERN = re.compile(u'[\u3000\uff01-\uff5e]+')
+
+
+def _dbc2sbc_repl(match):
+    return match.group().translate(DBC2SBC_MAP)
+
+
 def DBC2SBC(data):
     '''
     全角转半角
     '''
-    res = ""
-    for uchar in data:
-        inside_code = ord(uchar)
-        if inside_code == 0x3000:
-            inside_code = 0x0020
-        else:
-            inside_code -= 0xfee0
-            if not (0x0021 <= inside_code and inside_code <= 0x7e):
-                res += uchar
-                continue
-        res += chr(inside_code)
-    return res
+    # 只翻译全角字符所在的片段, 其余字符不用逐个查表
+    return DBC2SBC_PATTERN.sub(_dbc2sbc_repl, data)
+
+
+SYMBOL_CN2EN = {
+    '。': '.',
+    '｡': '.',
+    '〝': '"',
+    '〞': '"',
+    "‛": "'",
+    '“': '"',
+    '”': '"',
+    "‘": "'",
+    "’": "'",
+    '～': '~',
+    '—': '-',
+    '＄': '$',
+    '￥': '$',
+    '【': '[',
+    '】': ']',
+    '》': '>',
+    '《': '<'
+}
+SYMBOL_CN2EN_TABLE = dict((ord(k), v) for k, v in SYMBOL_CN2EN.items())
+
+ROMAN2EN = {
+    'Ⅰ': 'I',
+    'Ⅱ': 'II',
+    'Ⅲ': 'III',
+    'Ⅳ': 'IV',
+    'Ⅴ': 'V',
+    'Ⅵ': 'VI',
+    'Ⅶ': 'VII',
+    'Ⅷ': 'VIII',
+    'Ⅸ': 'IX',
+    'Ⅹ': 'X',
+    'Ⅺ': 'XI',
+    'Ⅻ': 'XII',
+    'ⅰ':'i',
+    'ⅱ':'ii',
+    'ⅲ':'iii',
+    'ⅳ':'iv',
+    'ⅴ':'v',
+    'ⅵ':'vi',
+    'ⅶ':'vii',
+    'ⅷ':'viii',
+    'ⅸ':'ix',
+    'ⅹ':'x',
+    'ⅺ':'xi',
+    'ⅻ':'xii'
+}
+ROMAN2EN_TABLE = dict((ord(k), v) for k, v in ROMAN2EN.items())
 
 
 def symbol_cn2en(data):
@@ -104,27 +147,7 @@ def symbol_cn2en(data):
     '''
     if not data:
         return data
-    d = {
-        '。': '.',
-        '｡': '.',
-        '〝': '"',
-        '〞': '"',
-        "‛": "'",
-        '“': '"',
-        '”': '"',
-        "‘": "'",
-        "’": "'",
-        '～': '~',
-        '—': '-',
-        '＄': '$',
-        '￥': '$',
-        '【': '[',
-        '】': ']',
-        '》': '>',
-        '《': '<'
-    }
-    table = ''.maketrans(d)
-    norm = data.translate(table)
+    norm = data.translate(SYMBOL_CN2EN_TABLE)
     return norm
 
 
@@ -134,34 +157,7 @@ def reverse_roman(data):
     '''
     if not data:
         return data
-    d = {
-        'Ⅰ': 'I',
-        'Ⅱ': 'II',
-        'Ⅲ': 'III',
-        'Ⅳ': 'IV',
-        'Ⅴ': 'V',
-        'Ⅵ': 'VI',
-        'Ⅶ': 'VII',
-        'Ⅷ': 'VIII',
-        'Ⅸ': 'IX',
-        'Ⅹ': 'X',
-        'Ⅺ': 'XI',
-        'Ⅻ': 'XII',
-        'ⅰ':'i',
-        'ⅱ':'ii',
-        'ⅲ':'iii',
-        'ⅳ':'iv',
-        'ⅴ':'v',
-        'ⅵ':'vi',
-        'ⅶ':'vii',
-        'ⅷ':'viii',
-        'ⅸ':'ix',
-        'ⅹ':'x',
-        'ⅺ':'xi',
-        'ⅻ':'xii'
-    }
-    table = ''.maketrans(d)
-    norm = data.translate(table)
+    norm = data.translate(ROMAN2EN_TABLE)
     return norm
 
 
@@ -199,7 +195,7 @@ def standard_string_format(
     if not data:
         return data
     if no_space:
-        data = re.sub('\s', '', data)
+        data = SPACE_PATTERN.sub('', data)
     if upper:
         data = data.upper()
     if lower:
@@ -215,5 +211,77 @@ def standard_string_format(
     return data
 
 
+class Normalizer(object):
+    '''
+    把standard_string_format的一组参数编译成一张str.translate映射表, 一次遍历完成全角转半角、中文标点、罗马数字和异常字符的转换,
+    输出与standard_string_format完全相同. 适合用同一组参数处理大量字符串:
+        norm = Normalizer(upper=1)
+        for line in lines:
+            norm(line)
+    参数含义同standard_string_format
+    '''
+
+    def __init__(self, ds=1, no_roman=1, en_punc=1, no_space=1, no_abnormal=1, upper=0, lower=0):
+        self.no_space = no_space
+        self.upper = upper
+        self.lower = lower
+        self.no_abnormal = no_abnormal
+        maps = []
+        if ds:
+            maps.append(DBC2SBC_MAP)
+        if en_punc:
+            maps.append(SYMBOL_CN2EN_TABLE)
+        if no_roman:
+            maps.append(ROMAN2EN_TABLE)
+        if no_abnormal:
+            # '､'->'、'不会产生或拆开'^?', 所以可以提前到映射表里
+            maps.append({ord('､'): '、'})
+        # 每一步都是逐字符映射, 所以逐字符复合各步的结果就是整体的映射
+        table = {}
+        for code in set(c for m in maps for c in m):
+            s = chr(code)
+            for m in maps:
+                s = ''.join(m.get(ord(c), c) for c in s)
+            if s != chr(code):
+                table[code] = s
+        self.table = table
+
+    def __call__(self, data):
+        if not data:
+            return data
+        if self.no_space:
+            data = SPACE_PATTERN.sub('', data)
+        # lower不是逐字符的(希腊字母词尾的sigma), 所以保持在映射表之前单独做
+        if self.upper:
+            data = data.upper()
+        if self.lower:
+            data = data.lower()
+        data = data.translate(self.table)
+        if self.no_abnormal:
+            data = data.replace('^?', '').replace('\x7f', '')
+        return data
+
+
+def _iter_file_lines(path, encoding):
+    with io.TextIOWrapper(open_file(path, 'rb'), encoding=encoding) as f:
+        for line in f:
+            yield line.rstrip('\r\n')
+
+
+def batch_standard_string_format(data, workers=None, chunk_size=10000, encoding='utf-8', **kwargs):
+    '''
+    批量格式化字符串, 按块分发到进程池, 按输入顺序流式返回结果
+    data: 字符串的可迭代对象, 或者文件路径(每行一个字符串, 去掉行尾换行符)
+    workers: 进程数, None或1表示在当前进程中处理
+    chunk_size: 每块的字符串数
+    encoding: 文件的编码
+    其余参数同standard_string_format
+    返回: 格式化后字符串的生成器
+    '''
+    if isinstance(data, str):
+        data = _iter_file_lines(data, encoding)
+    return _imap_worker(Normalizer, kwargs, data, workers=workers, chunk_size=chunk_size)
+
+
 if __name__ == '__main__':
     test()
@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+import io
 import sys
 import re
 import time
@@ -12,6 +13,13 @@ import pickle
 import codecs
 import json
 import subprocess
+import heapq
+import tempfile
+import functools
+import itertools
+import threading
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from collections import defaultdict
 
 try:
@@ -21,6 +29,9 @@ except ImportError:
 
 import six
 
+from .charclass import is_ascii
+from .compress import open_file, is_compressed
+
 try:
     from urlparse import urlparse
 except:
@@ -29,10 +40,12 @@ except:
 if six.PY2:
     try:
         from HTMLParser import HTMLParser
+        html_unescape = HTMLParser().unescape
     except:
         pass
 else:
     try:
+        from html import unescape as html_unescape
         from html.parser import HTMLParser
     except:
         pass
@@ -400,7 +413,230 @@ def log_kv(seq, log=logging.info, prefix='', postfix='', item_sep=';', vv_sep=',
     return None
 
 
-def file2dict(path, kn=0, vn=1, sep='\t', encoding='utf-8', ktype=None, vtype=None, skip_line=0):
+def _file_ranges(path, parts, begin=0):
+    """
+    Split a file into byte ranges [begin, end), every range ends at a newline.
+    """
+    size = os.path.getsize(path)
+    step = max((size - begin) // max(parts, 1), 1)
+    ranges = []
+    with open(path, 'rb') as f:
+        start = begin
+        while start < size:
+            end = start + step
+            if end >= size:
+                end = size
+            else:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _skip_line_offset(path, skip_line, encoding='utf-8'):
+    """
+    Find where the data begins after skipping skip_line non-blank lines.
+    @return: a tuple (offset, head). offset is the byte offset of the next raw line,
+             head is the remaining lines of the raw line in which the skipping ends.
+    """
+    if skip_line <= 0:
+        return 0, []
+    line_number = 0
+    offset = 0
+    with open(path, 'rb') as f:
+        for raw in f:
+            offset += len(raw)
+            lines = raw.decode(encoding).splitlines(True)
+            for i, line in enumerate(lines):
+                if not line.strip():
+                    continue
+                line_number += 1
+                if line_number == skip_line:
+                    return offset, lines[i + 1:]
+    return offset, []
+
+
+def _skip_lines(lines, skip_line):
+    """
+    Skip skip_line non-blank lines, the same as _skip_line_offset.
+    """
+    line_number = 0
+    for line in lines:
+        if line_number < skip_line:
+            if line.strip():
+                line_number += 1
+            continue
+        yield line
+
+
+def _fork_context():
+    """
+    The parsers and reducers are handed to the workers by fork, so they may be lambdas or closures.
+    Fork is not the default start method everywhere (forkserver on Linux since python 3.14),
+    so it is asked for explicitly. Without fork, e.g. on Windows, they must be picklable.
+    """
+    try:
+        return multiprocessing.get_context('fork')
+    except (AttributeError, ValueError):
+        return multiprocessing
+
+
+def _check_ascii_compatible(encoding):
+    # the byte ranges are split on b'\n', which must mean a newline in the encoding
+    if u'\t\n\r 09azAZ'.encode(encoding) != b'\t\n\r 09azAZ':
+        raise ValueError('invalid encoding: {0}. Please use an ASCII compatible encoding like utf-8 or gbk, '
+                         'or workers=None'.format(encoding))
+
+
+_CHUNK_PARSER = None
+
+
+def _init_chunk_parser(parser, encoding, binary):
+    global _CHUNK_PARSER
+    _CHUNK_PARSER = (parser, encoding, binary)
+
+
+def _parse_file_range(args):
+    path, begin, end = args
+    parser, encoding, binary = _CHUNK_PARSER
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        data = f.read(end - begin)
+    if binary:
+        return parser(data.split(b'\n'))
+    return parser(data.decode(encoding).splitlines(True))
+
+
+def parallel_parse(path, parser, workers, encoding='utf-8', skip_line=0, binary=False):
+    """
+    Parse a file in a process pool.
+    The file is split into byte ranges aligned on newlines, so the encoding must be ASCII compatible (utf-8, gbk...),
+    otherwise ValueError is raised. A compressed file is not split.
+    The parser is handed to the workers by fork, so it does not need to be picklable where fork is available
+    (Linux and macOS). On Windows it must be picklable.
+    @param path: input file path
+    @param parser: a function which parses an iterable of lines into a partial result
+    @param workers: the process number
+    @param encoding: the input encoding
+    @param skip_line: skip lines number, blank lines are not counted
+    @param binary: feed the parser with undecoded byte lines, see iter_binary_lines
+    @return: a list of partial results in file order. A compressed file can not be split,
+             so it is parsed in the current process as a single part.
+    """
+    if is_compressed(path):
+        with open_file(path, 'rb' if binary else 'r', encoding=encoding) as f:
+            lines = iter_binary_lines(f) if binary else f
+            return [parser(_skip_lines(lines, skip_line))]
+    _check_ascii_compatible(encoding)
+    begin, head = _skip_line_offset(path, skip_line, encoding)
+    parts = []
+    if head:
+        if binary:
+            head = [line.encode(encoding) for line in head]
+        parts.append(parser(head))
+    ranges = _file_ranges(path, workers * 4, begin)
+    if not ranges:
+        return parts
+    pool = _fork_context().Pool(workers, initializer=_init_chunk_parser, initargs=(parser, encoding, binary))
+    try:
+        parts.extend(pool.map(_parse_file_range, [(path, b, e) for b, e in ranges]))
+    finally:
+        pool.close()
+        pool.join()
+    return parts
+
+
+def iter_binary_lines(f, buffer_size=4 * 1024 * 1024):
+    """
+    Iterate the lines of a file opened in binary mode.
+    The file is read by large buffers and split on b'\n' only, the newline is not kept.
+    """
+    remain = b''
+    while True:
+        buf = f.read(buffer_size)
+        if not buf:
+            break
+        lines = (remain + buf).split(b'\n')
+        remain = lines.pop()
+        for line in lines:
+            yield line
+    if remain:
+        yield remain
+
+
+def _read_lines(path, parser, encoding='utf-8', engine='codecs', skip_line=0, workers=None):
+    """
+    Run a line parser over a file with the chosen engine, in a process pool if workers > 1.
+    """
+    if engine not in ('codecs', 'binary'):
+        raise ValueError('invalid engine: {0}. Please use "codecs" or "binary"'.format(engine))
+    binary = engine == 'binary'
+    if workers and workers > 1:
+        return parallel_parse(path, parser, workers, encoding=encoding, skip_line=skip_line, binary=binary)
+    if binary:
+        with open_file(path, 'rb') as f:
+            return [parser(iter_binary_lines(f), skip_line=skip_line)]
+    with open_file(path, encoding=encoding) as fp:
+        return [parser(fp, skip_line=skip_line)]
+
+
+def _lines2dict(lines, kn=0, vn=1, sep='\t', ktype=None, vtype=None, skip_line=0):
+    d = {}
+    line_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        line_number += 1
+        if line_number <= skip_line:
+            continue
+        tokens = line.rstrip('\n\r ').split(sep)
+        try:
+            key = tokens[kn]
+            if ktype:
+                key = ktype(key)
+            if vn is None:
+                value = tokens[:kn] + tokens[kn + 1:]
+            else:
+                value = tokens[vn]
+            if vtype:
+                value = vtype(value)
+            d[key] = value
+        except IndexError:
+            logging.exception('invalid line: %s' % line)
+    return d
+
+
+def _bin_lines2dict(lines, kn=0, vn=1, sep='\t', encoding='utf-8', ktype=None, vtype=None, skip_line=0):
+    bsep = sep.encode(encoding)
+    d = {}
+    line_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        line_number += 1
+        if line_number <= skip_line:
+            continue
+        tokens = line.rstrip(b'\n\r ').split(bsep)
+        try:
+            key = tokens[kn].decode(encoding)
+            if ktype:
+                key = ktype(key)
+            if vn is None:
+                value = [t.decode(encoding) for t in tokens[:kn] + tokens[kn + 1:]]
+            else:
+                value = tokens[vn].decode(encoding)
+            if vtype:
+                value = vtype(value)
+            d[key] = value
+        except IndexError:
+            logging.exception('invalid line: %s' % line.decode(encoding, 'replace'))
+    return d
+
+
+def file2dict(path, kn=0, vn=1, sep='\t', encoding='utf-8', ktype=None, vtype=None, skip_line=0, workers=None,
+              engine='codecs'):
     """
     build a dict from a file.
     @param path: input file path
@@ -411,35 +647,60 @@ def file2dict(path, kn=0, vn=1, sep='\t', encoding='utf-8', ktype=None, vtype=No
     @param ktype: custom a function applied to the key of each line
     @param vtype: custom a function applied to the value of each line
     @param skip_line: skip lines number
+    @param workers: parse the file in so many processes, see parallel_parse
+    @param engine: "codecs" reads decoded lines.
+                   "binary" reads large byte buffers, splits lines on "\n" only and decodes only the key and value columns.
     @return: a key value dict
     """
+    if engine == 'binary':
+        parser = functools.partial(_bin_lines2dict, kn=kn, vn=vn, sep=sep, encoding=encoding, ktype=ktype,
+                                   vtype=vtype)
+    else:
+        parser = functools.partial(_lines2dict, kn=kn, vn=vn, sep=sep, ktype=ktype, vtype=vtype)
     d = {}
+    for part in _read_lines(path, parser, encoding=encoding, engine=engine, skip_line=skip_line, workers=workers):
+        d.update(part)
+    return d
+
+
+def _iter_dictlist_items(lines, kn=0, vn=1, sep='\t', ktype=None, vtype=None, skip_line=0):
     line_number = 0
-    with codecs.open(path, encoding=encoding) as fp:
-        for line in fp:
-            if not line.strip():
-                continue
-            line_number += 1
-            if line_number <= skip_line:
-                continue
-            tokens = line.rstrip('\n\r ').split(sep)
-            try:
-                key = tokens[kn]
-                if ktype:
-                    key = ktype(key)
-                if vn is None:
-                    value = tokens[:kn] + tokens[kn + 1:]
-                else:
-                    value = tokens[vn]
-                if vtype:
-                    value = vtype(value)
-                d[key] = value
-            except IndexError:
-                logging.exception('invalid line: %s' % line)
+    for line in lines:
+        if not line.strip():
+            continue
+        line_number += 1
+        if line_number <= skip_line:
+            continue
+        tokens = line.rstrip('\n\r ').split(sep)
+        try:
+            key = tokens[kn]
+            if ktype:
+                key = ktype(key)
+            if vn is None:
+                value = tokens[:kn] + tokens[kn + 1:]
+            else:
+                value = tokens[vn]
+            if vtype:
+                value = vtype(value)
+        except:
+            logging.exception('invalid line: %s' % line)
+            continue
+        yield key, value
+
+
+def _lines2dictlist(lines, kn=0, vn=1, sep='\t', ktype=None, vtype=None, skip_line=0):
+    d = defaultdict(list)
+    for key, value in _iter_dictlist_items(lines, kn=kn, vn=vn, sep=sep, ktype=ktype, vtype=vtype,
+                                           skip_line=skip_line):
+        if isinstance(value, list):
+            d[key].extend(value)
+        else:
+            d[key].append(value)
     return d
 
 
-def file2dictlist(path, kn=0, vn=1, sep='\t', encoding='utf-8', dup=True, ktype=None, vtype=None, skip_line=0):
+def file2dictlist(path, kn=0, vn=1, sep='\t', encoding='utf-8', dup=True, ktype=None, vtype=None, skip_line=0,
+                  workers=None):
     """
     Build a dict from a file merging the values of same key into list.
     @param path: input file path
@@ -451,43 +712,184 @@ def file2dictlist(path, kn=0, vn=1, sep='\t', encoding='utf-8', dup=True, ktype=
     @param ktype: custom a function applied to the key of each line
     @param vtype: custom a function applied to the value of each line
     @param skip_line: skip lines number
+    @param workers: parse the file in so many processes, see parallel_parse
     @return: a key value dict
     """
-    d = defaultdict(list)
-    line_number = 0
-    with codecs.open(path, encoding=encoding) as fp:
-        for line in fp:
-            if not line.strip():
-                continue
-            line_number += 1
-            if line_number <= skip_line:
-                continue
-            tokens = line.rstrip('\n\r ').split(sep)
-            try:
-                key = tokens[kn]
-                if ktype:
-                    key = ktype(key)
-                if vn is None:
-                    value = tokens[:kn] + tokens[kn + 1:]
-                else:
-                    value = tokens[vn]
-                if vtype:
-                    value = vtype(value)
-                if isinstance(value, list):
-                    d[key].extend(value)
-                else:
-                    d[key].append(value)
-            except:
-                logging.exception('invalid line: %s' % line)
-        for key in d.keys():
-            if dup:
-                d[key] = sorted(d[key])
-            else:
-                d[key] = sorted(list(set(d[key])))
+    if workers and workers > 1:
+        parser = functools.partial(_lines2dictlist, kn=kn, vn=vn, sep=sep, ktype=ktype, vtype=vtype)
+        d = defaultdict(list)
+        for part in parallel_parse(path, parser, workers, encoding=encoding, skip_line=skip_line):
+            for key, values in part.items():
+                d[key].extend(values)
+    else:
+        with open_file(path, encoding=encoding) as fp:
+            d = _lines2dictlist(fp, kn=kn, vn=vn, sep=sep, ktype=ktype, vtype=vtype, skip_line=skip_line)
+    for key in d.keys():
+        if dup:
+            d[key] = sorted(d[key])
+        else:
+            d[key] = sorted(list(set(d[key])))
     return d
 
 
-def dict2file(d, path, encoding='utf-8', kfunc=None, vfunc=None, sep='\t'):
+def _dump_run(entries, tmp_dir=None):
+    entries.sort()
+    f = tempfile.TemporaryFile(dir=tmp_dir)
+    for entry in entries:
+        pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+    f.seek(0)
+    return f
+
+
+def _load_run(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            break
+
+
+# the most runs merged at once, each open run takes a file descriptor
+MAX_MERGE_RUNS = 64
+
+
+def _merge_runs(runs, tmp_dir=None):
+    f = tempfile.TemporaryFile(dir=tmp_dir)
+    try:
+        pickler = pickle.Pickler(f, pickle.HIGHEST_PROTOCOL)
+        # no memo, every entry is loaded alone by pickle.load
+        pickler.fast = True
+        for entry in heapq.merge(*[_load_run(r) for r in runs]):
+            pickler.dump(entry)
+    except BaseException:
+        f.close()
+        raise
+    for r in runs:
+        r.close()
+    f.seek(0)
+    return f
+
+
+def _add_run(runs, levels, f, tmp_dir=None):
+    """
+    Append a run, merging the runs by levels: every MAX_MERGE_RUNS runs of a level are merged into one run
+    of the next level, so few runs are open and every entry is rewritten only log(runs) times.
+    """
+    runs.append(f)
+    levels.append(0)
+    n = MAX_MERGE_RUNS
+    while len(runs) >= n and levels[-n] == levels[-1]:
+        merged = _merge_runs(runs[-n:], tmp_dir)
+        level = levels[-1] + 1
+        del runs[-n:]
+        del levels[-n:]
+        runs.append(merged)
+        levels.append(level)
+
+
+def iter_file2dictlist(path, kn=0, vn=1, sep='\t', encoding='utf-8', dup=True, ktype=None, vtype=None, skip_line=0,
+                       max_memory=256 * 1024 * 1024, tmp_dir=None):
+    """
+    The bounded memory version of file2dictlist.
+    Values are spilled to sorted temp runs whenever the buffered values exceed max_memory,
+    and at most MAX_MERGE_RUNS runs are merged at once, lazily for the last merge,
+    so dict(iter_file2dictlist(...)) == file2dictlist(...).
+    Keys and values must be orderable and picklable.
+    @param max_memory: the approximate bytes of the values buffered in memory
+    @param tmp_dir: the directory of the temp runs
+    The other parameters are the same as file2dictlist
+    @return: a generator of (key, sorted value list) in key order
+    """
+    runs = []
+    levels = []
+    entries = []
+    size = 0
+    try:
+        with open_file(path, encoding=encoding) as fp:
+            for key, value in _iter_dictlist_items(fp, kn=kn, vn=vn, sep=sep, ktype=ktype, vtype=vtype,
+                                                   skip_line=skip_line):
+                if not isinstance(value, list):
+                    value = [value]
+                # (key, 0) keeps a key whose value list is empty
+                entries.append((key, 0))
+                size += sys.getsizeof(key) + 64
+                for v in value:
+                    entries.append((key, 1, v))
+                    size += sys.getsizeof(v) + 64
+                if size >= max_memory:
+                    _add_run(runs, levels, _dump_run(entries, tmp_dir), tmp_dir)
+                    entries = []
+                    size = 0
+        if runs:
+            if entries:
+                _add_run(runs, levels, _dump_run(entries, tmp_dir), tmp_dir)
+            entries = None
+            while len(runs) > MAX_MERGE_RUNS:
+                merged = _merge_runs(runs[:MAX_MERGE_RUNS], tmp_dir)
+                runs[:MAX_MERGE_RUNS] = [merged]
+            merged = heapq.merge(*[_load_run(f) for f in runs])
+        else:
+            entries.sort()
+            merged = iter(entries)
+
+        last_key = None
+        values = None
+        for entry in merged:
+            key = entry[0]
+            if values is None or key != last_key:
+                if values is not None:
+                    yield last_key, values
+                last_key = key
+                values = []
+            if len(entry) == 3:
+                if dup or not values or values[-1] != entry[2]:
+                    values.append(entry[2])
+        if values is not None:
+            yield last_key, values
+    finally:
+        for f in runs:
+            f.close()
+
+
+def _escape_format(s):
+    return s.replace(u'{', u'{{').replace(u'}', u'}}')
+
+
+def _dump_lines(path, lines, encoding, batch_size):
+    # one incremental encoder for the whole file, so a BOM is written only once
+    encode = codecs.getincrementalencoder(encoding)().encode
+    with open_file(path, 'wb') as fo:
+        for batch in _iter_chunks(lines, batch_size):
+            fo.write(encode(u''.join(batch)))
+        fo.write(encode(u'', True))
+
+
+def _write_lines(path, lines, encoding='utf-8', atomic=False, batch_size=10000):
+    """
+    Write unicode lines in batches: each batch is joined and encoded once and written in one call.
+    @param atomic: write to a temp file in the same directory, sync it to disk and replace path with it
+                   at the end, so path is either the old file or the complete new one
+    """
+    if not atomic:
+        _dump_lines(path, lines, encoding, batch_size)
+        return
+    root, ext = os.path.splitext(path)
+    # keep the extension, the compression is chosen by it
+    tmp_path = '{0}.tmp{1}.{2}{3}'.format(root, os.getpid(), threading.current_thread().ident, ext)
+    try:
+        _dump_lines(tmp_path, lines, encoding, batch_size)
+        # sync after close, a compressed file writes its trailer on close
+        with open(tmp_path, 'rb+') as f:
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def dict2file(d, path, encoding='utf-8', kfunc=None, vfunc=None, sep='\t', sort_keys=False, atomic=False,
+              batch_size=10000):
     """
     Dump a dict to a file.
     @param d: the dict to be dumpped
@@ -496,20 +898,47 @@ def dict2file(d, path, encoding='utf-8', kfunc=None, vfunc=None, sep='\t'):
     @param kfunc: a function applied to the key
     @param vfunc: a function applied to the value
     @param sep: the seperator of the output file
+    @param sort_keys: write the items in the order of the keys, before kfunc is applied
+    @param atomic: write to a temp file and rename it to path, see _write_lines
+    @param batch_size: the number of lines formatted and written at once
     @return: always return None
     """
-    with codecs.open(path, 'wb', encoding=encoding) as fo:
-        for key, value in d.iteritems():
-            if kfunc is not None:
-                key = kfunc(key)
-            if vfunc is not None:
-                value = vfunc(value)
-            outline = u'{}{}{}\n'.format(key, sep, value)
-            fo.write(outline)
+    items = sorted(six.iteritems(d)) if sort_keys else six.iteritems(d)
+    if kfunc is not None or vfunc is not None:
+        kfunc = kfunc or (lambda k: k)
+        vfunc = vfunc or (lambda v: v)
+        items = ((kfunc(key), vfunc(value)) for key, value in items)
+    fmt = (u'{}' + _escape_format(sep) + u'{}\n').format
+    lines = (fmt(key, value) for key, value in items)
+    _write_lines(path, lines, encoding=encoding, atomic=atomic, batch_size=batch_size)
     return None
 
 
-def file2ddict(path, k1n=0, k2n=1, vn=2, sep='\t', encoding='utf-8', k1type=None, k2type=None, vtype=None):
+def _lines2ddict(lines, k1n=0, k2n=1, vn=2, sep='\t', k1type=None, k2type=None, vtype=None):
+    d = defaultdict(dict)
+    for line in lines:
+        tokens = line.rstrip('\n\r ').split(sep)
+        try:
+            k1 = tokens[k1n]
+            k2 = tokens[k2n]
+            if k1type:
+                k1 = k1type(k1)
+            if k2type:
+                k2 = k2type(k2)
+            if vn is None:
+                value = [tokens[i] for i in range(len(tokens)) if i != k1n and i != k2n]
+            else:
+                value = tokens[vn]
+            if vtype:
+                value = vtype(value)
+            d[k1][k2] = value
+        except IndexError:
+            logging.exception('invalid line: %s' % line)
+    return d
+
+
+def file2ddict(path, k1n=0, k2n=1, vn=2, sep='\t', encoding='utf-8', k1type=None, k2type=None, vtype=None,
+               workers=None):
     """
     build a two level dict from a file.
     @param path: input file path
@@ -518,35 +947,26 @@ def file2ddict(path, k1n=0, k2n=1, vn=2, sep='\t', encoding='utf-8', k1type=None
     @param vn: the column number of value
     @param sep: the field seperator
     @param encoding: the input encoding
+    @param workers: parse the file in so many processes, see parallel_parse
     @return: a key value dict
 
     """
-    d = defaultdict(dict)
-    with codecs.open(path, encoding=encoding) as fp:
-        for line in fp:
-            tokens = line.rstrip('\n\r ').split(sep)
-            try:
-                k1 = tokens[k1n]
-                k2 = tokens[k2n]
-                if k1type:
-                    k1 = k1type(k1)
-                if k2type:
-                    k2 = k2type(k2)
-                if vn is None:
-                    value = [tokens[i] for i in range(len(tokens)) if i != k1n and i != k2n]
-                else:
-                    value = tokens[vn]
-                if vtype:
-                    value = vtype(value)
-                d[k1][k2] = value
-            except IndexError:
-                logging.exception('invalid line: %s' % line)
-    return d
+    kwargs = dict(k1n=k1n, k2n=k2n, vn=vn, sep=sep, k1type=k1type, k2type=k2type, vtype=vtype)
+    if workers and workers > 1:
+        parser = functools.partial(_lines2ddict, **kwargs)
+        d = defaultdict(dict)
+        for part in parallel_parse(path, parser, workers, encoding=encoding):
+            for k1, d2 in part.items():
+                d[k1].update(d2)
+        return d
+    with open_file(path, encoding=encoding) as fp:
+        return _lines2ddict(fp, **kwargs)
 
 
-def ddict2file(d, path, encoding='utf-8', k1func=None, k2func=None, vfunc=None, sep='\t'):
+def ddict2file(d, path, encoding='utf-8', k1func=None, k2func=None, vfunc=None, sep='\t', sort_keys=False,
+               atomic=False, batch_size=10000):
     """
-    Dump a two level dict to a file.
+    Dump a two level dict to a file, a line for each value.
     @param d: the dict to be dumpped
     @param path: the output file path
     @param encoding: the output file encoding
@@ -554,23 +974,70 @@ def ddict2file(d, path, encoding='utf-8', k1func=None, k2func=None, vfunc=None,
     @param k2func: a function applied to the key 2
     @param vfunc: a function applied to the value
     @param sep: the seperator of the output file
+    @param sort_keys: write the lines in the order of key 1 and key 2, before the functions are applied
+    @param atomic: write to a temp file and rename it to path, see _write_lines
+    @param batch_size: the number of lines formatted and written at once
     @return: always return None
     """
-    with codecs.open(path, 'wb', encoding=encoding) as fo:
-        for k1, d2 in d.iteritems():
+    esep = _escape_format(sep)
+    fmt = (u'{}' + esep + u'{}' + esep + u'{}\n').format
+    k2func = k2func or (lambda k: k)
+    vfunc = vfunc or (lambda v: v)
+
+    def iter_lines():
+        for k1, d2 in (sorted(six.iteritems(d)) if sort_keys else six.iteritems(d)):
             if k1func is not None:
                 k1 = k1func(k1)
-            for k2, value in d2.iteritems():
-                if k2func is not None:
-                    k2 = k2func(k2)
-                if vfunc is not None:
-                    value = vfunc(value)
-            outline = u'{}{}{}{}{}\n'.format(k1, sep, k2, sep, value)
-            fo.write(outline)
+            items = sorted(six.iteritems(d2)) if sort_keys else six.iteritems(d2)
+            for k2, value in items:
+                yield fmt(k1, k2func(k2), vfunc(value))
+
+    _write_lines(path, iter_lines(), encoding=encoding, atomic=atomic, batch_size=batch_size)
     return None
 
 
-def file2list(path, n=0, sep='\t', encoding='utf-8', typ=None, skip_line=0):
+def _lines2list(lines, n=0, sep='\t', typ=None, skip_line=0):
+    d = []
+    line_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        line_number += 1
+        if line_number <= skip_line:
+            continue
+        tokens = line.rstrip('\n\r ').split(sep)
+        try:
+            value = tokens[n]
+            if typ:
+                value = typ(value)
+            d.append(value)
+        except IndexError:
+            logging.exception('invalid line: %s' % line)
+    return d
+
+
+def _bin_lines2list(lines, n=0, sep='\t', encoding='utf-8', typ=None, skip_line=0):
+    bsep = sep.encode(encoding)
+    d = []
+    line_number = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        line_number += 1
+        if line_number <= skip_line:
+            continue
+        tokens = line.rstrip(b'\n\r ').split(bsep)
+        try:
+            value = tokens[n].decode(encoding)
+            if typ:
+                value = typ(value)
+            d.append(value)
+        except IndexError:
+            logging.exception('invalid line: %s' % line.decode(encoding, 'replace'))
+    return d
+
+
+def file2list(path, n=0, sep='\t', encoding='utf-8', typ=None, skip_line=0, workers=None, engine='codecs'):
     """
     build a list from a file.
     @param path: input file path
@@ -578,55 +1045,50 @@ def file2list(path, n=0, sep='\t', encoding='utf-8', typ=None, skip_line=0):
     @param sep: the field seperator
     @param encoding: the input encoding
     @param skip_line: skip lines number
+    @param workers: parse the file in so many processes, see parallel_parse
+    @param engine: "codecs" or "binary", see file2dict
     @return: a list
 
     """
-    d = []
     if not os.path.exists(path):
-        return d
-    line_number = 0
-    with codecs.open(path, encoding=encoding) as fp:
-        for line in fp:
-            if not line.strip():
-                continue
-            line_number += 1
-            if line_number <= skip_line:
-                continue
-            tokens = line.rstrip('\n\r ').split(sep)
-            try:
-                value = tokens[n]
-                if typ:
-                    value = typ(value)
-                d.append(value)
-            except IndexError:
-                logging.exception('invalid line: %s' % line)
+        return []
+    if engine == 'binary':
+        parser = functools.partial(_bin_lines2list, n=n, sep=sep, encoding=encoding, typ=typ)
+    else:
+        parser = functools.partial(_lines2list, n=n, sep=sep, typ=typ)
+    d = []
+    for part in _read_lines(path, parser, encoding=encoding, engine=engine, skip_line=skip_line, workers=workers):
+        d.extend(part)
     return d
 
 
-def file2set(path, n=0, sep='\t', encoding='utf-8', typ=None, skip_line=0):
+def file2set(path, n=0, sep='\t', encoding='utf-8', typ=None, skip_line=0, workers=None, engine='codecs'):
     """
     build a set from a file.
     The parameters are the same as file2list
     @return: a set
     """
-    return set(file2list(path, n=n, sep=sep, encoding=encoding, typ=typ, skip_line=skip_line))
+    return set(file2list(path, n=n, sep=sep, encoding=encoding, typ=typ, skip_line=skip_line, workers=workers,
+                         engine=engine))
 
 
-def set2file(d, path, encoding='utf-8', func=None):
+def set2file(d, path, encoding='utf-8', func=None, sort_keys=False, atomic=False, batch_size=10000):
     """
     Dump a set to a file.
     @param d: the set to be dumpped
     @param path: the output file path
     @param encoding: the output file encoding
     @param func: a function applied to the value
+    @param sort_keys: write the values in order, before func is applied
+    @param atomic: write to a temp file and rename it to path, see _write_lines
+    @param batch_size: the number of lines formatted and written at once
     @return: always return None
     """
-    with codecs.open(path, 'wb', encoding=encoding) as fo:
-        for value in d:
-            if func is not None:
-                value = func(value)
-            outline = u'{}\n'.format(value)
-            fo.write(outline)
+    values = sorted(d) if sort_keys else d
+    if func is not None:
+        values = (func(value) for value in values)
+    lines = (u'{}\n'.format(value) for value in values)
+    _write_lines(path, lines, encoding=encoding, atomic=atomic, batch_size=batch_size)
     return None
 
 
@@ -675,35 +1137,205 @@ def p(obj, encoding='utf-8', indent=0):
     return None
 
 
+LONG_SENTENCE_SEP = u'\x03\x04。！？；!?;'
+SHORT_SENTENCE_SEP = u'，,:： '
+_SENTENCE_PATTERNS = {}
+
+
+def _sentence_pattern(long_sep, short_sep):
+    """
+    The pattern of one separator char, group 1 matches a long sentence separator.
+    Only the separators are scanned, a long text without them is not backtracked.
+    """
+    pattern = _SENTENCE_PATTERNS.get((long_sep, short_sep))
+    if pattern is None:
+        # a char in both sets ends a short sentence, the same as splite_sentence
+        long_only = u''.join(c for c in long_sep if c not in short_sep)
+        alternatives = []
+        if long_only:
+            alternatives.append(u'([%s])' % re.escape(long_only))
+        if short_sep:
+            alternatives.append(u'[%s]' % re.escape(short_sep))
+        if not alternatives:
+            raise ValueError('at least one separator is required')
+        pattern = re.compile(u'|'.join(alternatives))
+        _SENTENCE_PATTERNS[(long_sep, short_sep)] = pattern
+    return pattern
+
+
+def _iter_sentence_spans(chunks, long_sep, short_sep, with_text=False):
+    pattern = _sentence_pattern(long_sep, short_sep)
+    long_idx = 0
+    short_idx = 0
+    # the stream offsets of the current sentence and of the chunk
+    start = 0
+    offset = 0
+    # the pieces of the unfinished sentence, each chunk is scanned only once
+    pieces = []
+    for chunk in chunks:
+        pos = 0
+        for m in pattern.finditer(chunk):
+            end = offset + m.end()
+            if with_text:
+                pieces.append(chunk[pos:m.end()])
+                yield long_idx, short_idx, start, end, u''.join(pieces)
+                pieces = []
+            else:
+                yield long_idx, short_idx, start, end
+            if m.lastindex:
+                long_idx += 1
+                short_idx = 0
+            else:
+                short_idx += 1
+            start = end
+            pos = m.end()
+        if with_text and pos < len(chunk):
+            pieces.append(chunk[pos:])
+        offset += len(chunk)
+    if offset > start:
+        if with_text:
+            yield long_idx, short_idx, start, offset, u''.join(pieces)
+        else:
+            yield long_idx, short_idx, start, offset
+
+
+def iter_sentence_spans(text, long_sep=LONG_SENTENCE_SEP, short_sep=SHORT_SENTENCE_SEP):
+    """
+    Split text into long sentences, and each long sentence into short sentences.
+    Every sentence keeps its separator at the end, like splite_sentence.
+    @param text: unicode string
+    @param long_sep: the chars ending a long sentence
+    @param short_sep: the chars ending a short sentence
+    @return: a generator of (long_idx, short_idx, start, end), text[start:end] is the sentence
+    """
+    return _iter_sentence_spans([text], long_sep, short_sep)
+
+
+def iter_file_sentences(f, long_sep=LONG_SENTENCE_SEP, short_sep=SHORT_SENTENCE_SEP, encoding='utf-8',
+                        buffer_size=65536):
+    """
+    Split a file stream the same way as iter_sentence_spans, reading buffer_size chars at a time.
+    Newlines are ordinary chars unless they are in the separators.
+    @param f: a file path, or a file object opened in text mode
+    @return: a generator of (long_idx, short_idx, start, end, sentence), start and end are char offsets in the stream
+    """
+    if isinstance(f, six.string_types):
+        with io.TextIOWrapper(open_file(f, 'rb'), encoding=encoding) as fp:
+            for span in iter_file_sentences(fp, long_sep, short_sep, buffer_size=buffer_size):
+                yield span
+        return
+    chunks = iter(functools.partial(f.read, buffer_size), u'')
+    for span in _iter_sentence_spans(chunks, long_sep, short_sep, with_text=True):
+        yield span
+
+
 def splite_sentence(text):
-    long_sep = u'\x03\x04。！？；!?;'
-    short_sep = u'，,:： '
+    """
+    @return: a list of long sentences, each is a list of its short sentences
+    """
     long_sents = []
-    offset_begin = 0
     short_sents = []
-    for i, e in enumerate(text):
-        if e in short_sep:
-            short_sents.append(text[offset_begin:i + 1])
-            offset_begin = i + 1
-        elif e in long_sep:
-            short_sents.append(text[offset_begin:i + 1])
+    pos = 0
+    for m in _sentence_pattern(LONG_SENTENCE_SEP, SHORT_SENTENCE_SEP).finditer(text):
+        short_sents.append(text[pos:m.end()])
+        if m.lastindex:
             long_sents.append(short_sents)
             short_sents = []
-            offset_begin = i + 1
-        else:
-            pass
-    if offset_begin != len(text):
-        short_sents.append(text[offset_begin:])
+        pos = m.end()
+    if pos != len(text):
+        short_sents.append(text[pos:])
     if short_sents:
         long_sents.append(short_sents)
     return long_sents
 
 
-def file_line_num(path, encoding='utf-8'):
-    with codecs.open(path, encoding=encoding) as fp:
-        for i, _ in enumerate(fp):
-            pass
-    return i + 1
+def _count_newlines(args):
+    path, begin, end = args
+    num = 0
+    with open(path, 'rb') as f:
+        f.seek(begin)
+        remain = end - begin
+        while remain > 0:
+            buf = f.read(min(remain, 4 * 1024 * 1024))
+            if not buf:
+                break
+            num += buf.count(b'\n')
+            remain -= len(buf)
+    return num
+
+
+def file_line_num(path, encoding='utf-8', engine='binary', workers=None, cache=False):
+    """
+    Count the lines of a file.
+    @param path: input file path
+    @param encoding: the input encoding, only used by the codecs engine
+    @param engine: "binary" counts "\n" over large byte buffers.
+                   "codecs" iterates the decoded lines, so "\r" and the unicode line separators are counted too.
+    @param workers: count the byte ranges of the file in so many threads, only for the binary engine
+                    and a plain file
+    @param cache: save the number in the hidden sidecar file ".<name>.linenum" next to the file, which is
+                  reused while the size and the mtime of the file are unchanged
+    @return: the line number
+    """
+    if engine not in ('codecs', 'binary'):
+        raise ValueError('invalid engine: {0}. Please use "codecs" or "binary"'.format(engine))
+    stat = os.stat(path)
+    # hidden, so that the directory readers do not take it for data
+    directory, name = os.path.split(path)
+    sidecar = os.path.join(directory, '.{0}.linenum'.format(name))
+    if cache and os.path.exists(sidecar):
+        try:
+            with open(sidecar) as f:
+                info = json.load(f)
+            if info['size'] == stat.st_size and info['mtime'] == stat.st_mtime and info['engine'] == engine:
+                return info['num']
+        except (IOError, ValueError, KeyError):
+            logging.warning('invalid line number cache: %s' % sidecar)
+
+    num = 0
+    if engine == 'binary' and is_compressed(path):
+        # the decompressed stream can only be counted from the beginning
+        last = b''
+        with open_file(path, 'rb') as f:
+            while True:
+                buf = f.read(4 * 1024 * 1024)
+                if not buf:
+                    break
+                num += buf.count(b'\n')
+                last = buf[-1:]
+        if last and last != b'\n':
+            num += 1
+    elif engine == 'binary':
+        size = stat.st_size
+        if workers and workers > 1 and size > 0:
+            step = size // workers + 1
+            ranges = [(path, b, min(b + step, size)) for b in range(0, size, step)]
+            pool = ThreadPool(workers)
+            try:
+                num = sum(pool.map(_count_newlines, ranges))
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            num = _count_newlines((path, 0, size))
+        # the last line without newline
+        if size > 0:
+            with open(path, 'rb') as f:
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    num += 1
+    else:
+        with open_file(path, encoding=encoding) as fp:
+            for num, _ in enumerate(fp, 1):
+                pass
+
+    if cache:
+        try:
+            with open(sidecar, 'w') as f:
+                json.dump({'size': stat.st_size, 'mtime': stat.st_mtime, 'engine': engine, 'num': num}, f)
+        except IOError:
+            logging.warning('fail to write line number cache: %s' % sidecar)
+    return num
 
 
 def timer(logfmt=None):
@@ -787,6 +1419,50 @@ def xml2list(xml):
     return ret
 
 
+def _iter_subsents(f, tag='subsent'):
+    # the same elements as findall('./*/subsent'), the children of root are cleared when they end
+    root = None
+    depth = 0
+    for event, elem in ET.iterparse(f, events=('start', 'end')):
+        if event == 'start':
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth == 2 and elem.tag == tag:
+            yield six.text_type(elem.text)
+        elif depth == 1:
+            root.clear()
+
+
+def iter_xml2list(xml, tag='subsent'):
+    """
+    The streaming version of xml2list, the texts are yielded as they are parsed.
+    @param xml: unicode or utf-8 bytes xml string
+    @param tag: the tag of the grandchildren of root to collect
+    @return: a generator of the texts. ET.ParseError is raised when the invalid part is reached.
+    """
+    if isinstance(xml, six.text_type):
+        xml = xml.encode('utf-8')
+    return _iter_subsents(io.BytesIO(xml), tag)
+
+
+def iter_file_xml2list(f, tag='subsent'):
+    """
+    Parse a xml file like iter_xml2list in constant memory, for large xml dumps.
+    @param f: a file path, or a file object opened in binary mode
+    @return: a generator of the texts
+    """
+    if isinstance(f, six.string_types):
+        with open_file(f, 'rb') as fp:
+            for text in _iter_subsents(fp, tag):
+                yield text
+        return
+    for text in _iter_subsents(f, tag):
+        yield text
+
+
 def append_file(a, b, encoding='utf-8'):
     """
     append file a to file b
@@ -906,7 +1582,19 @@ def norm_url(url):
         return new_url
 
 
-def iter_by_key(iterable, key_idx=0, func=None, filter_func=None):
+def iter_by_key(iterable, key_idx=0, func=None, filter_func=None, raw=False, errors=None):
+    """
+    Group the consecutive items which have the same key.
+    @param iterable: the items, lists or tuples
+    @param key_idx: the index of the key in an item
+    @param func: a function applied to each item first, the items on which it raises are skipped
+    @param filter_func: skip the items for which it returns False
+    @param raw: put the whole items in info_list without removing the key, which saves
+                the slices and the new list built for every item
+    @param errors: a dict counting the skipped items, errors['func'] when func raises
+                   and errors['key'] when the item has no key_idx
+    @return: a generator of (key, info_list)
+    """
     info_list = []
     last_key = None
     key = None
@@ -914,15 +1602,24 @@ def iter_by_key(iterable, key_idx=0, func=None, filter_func=None):
         if func:
             try:
                 item = func(item)
-            except:
+            except Exception:
+                if errors is not None:
+                    errors['func'] = errors.get('func', 0) + 1
                 continue
         if filter_func and not filter_func(item):
             continue
         try:
             key = item[key_idx]
         except IndexError:
+            if errors is not None:
+                errors['key'] = errors.get('key', 0) + 1
             continue
-        remain = item[:key_idx] + item[key_idx + 1:]
+        if raw:
+            remain = item
+        elif key_idx == 0:
+            remain = item[1:]
+        else:
+            remain = item[:key_idx] + item[key_idx + 1:]
 
         # Continue the same key
         if key == last_key:
@@ -938,29 +1635,342 @@ def iter_by_key(iterable, key_idx=0, func=None, filter_func=None):
             last_key = key
     # The last key of the file
     if info_list:
-        yield (key, info_list)
+        yield (last_key, info_list)
 
 
-def iter_file_by_key(path, key_idx=0, encoding='utf-8', sep='\t', func=None, filter_func=None):
-    info_list = []
-    key = None
-    with codecs.open(path, encoding=encoding) as f:
+def _decode_tokens(lines, encoding='utf-8', sep='\t'):
+    # an undecodable line raises UnicodeDecodeError like the codecs engine
+    bsep = sep.encode(encoding)
+    for line in lines:
+        yield [t.decode(encoding) for t in line.strip(b'\n\r ').split(bsep)]
 
-        def line_func(line):
-            return line.strip('\n\r ').split(sep)
 
-        if func:
-            new_func = lambda line: func(line_func(line))
+def _iter_file_tokens(path, encoding='utf-8', sep='\t', engine='codecs', threaded=True):
+    if engine not in ('codecs', 'binary'):
+        raise ValueError('invalid engine: {0}. Please use "codecs" or "binary"'.format(engine))
+    if engine == 'binary':
+        with open_file(path, 'rb', threaded=threaded) as f:
+            for tokens in _decode_tokens(iter_binary_lines(f), encoding=encoding, sep=sep):
+                yield tokens
+    else:
+        with open_file(path, encoding=encoding, threaded=threaded) as f:
+            for line in f:
+                yield line.strip('\n\r ').split(sep)
+
+
+def _line_sort_key(key_idx, bsep):
+    def sort_key(line):
+        # the same key as iter_file_by_key, b'' for the lines without the key column
+        tokens = line.strip(b'\n\r ').split(bsep, key_idx + 1)
+        return tokens[key_idx] if len(tokens) > key_idx else b''
+
+    return sort_key
+
+
+def _sort_range_runs(args):
+    """
+    Sort the lines of a byte range into runs of about max_memory bytes.
+    @return: the paths of the sorted run files
+    """
+    path, begin, end, key_idx, bsep, max_memory, tmp_dir = args
+    sort_key = _line_sort_key(key_idx, bsep)
+    runs = []
+
+    def dump(lines):
+        lines.sort(key=sort_key)
+        with tempfile.NamedTemporaryFile(dir=tmp_dir, prefix='huosort.', delete=False) as fo:
+            runs.append(fo.name)
+            fo.writelines(lines)
+
+    lines = []
+    size = 0
+    try:
+        # end is None for a compressed file, which is read to the end
+        with open_file(path, 'rb') as f:
+            if begin:
+                f.seek(begin)
+            pos = begin
+            while end is None or pos < end:
+                line = f.readline()
+                if not line:
+                    break
+                pos += len(line)
+                if not line.endswith(b'\n'):
+                    line += b'\n'
+                lines.append(line)
+                # the line, its key and the list slots
+                size += 2 * len(line) + 100
+                if size >= max_memory:
+                    dump(lines)
+                    lines = []
+                    size = 0
+        if lines:
+            dump(lines)
+    except BaseException:
+        for run in runs:
+            os.remove(run)
+        raise
+    return runs
+
+
+def iter_sorted_lines(path, key_idx=0, sep='\t', encoding='utf-8', max_memory=256 * 1024 * 1024, tmp_dir=None,
+                      workers=None):
+    """
+    External merge sort of the lines of a file by a key column, in bounded memory.
+    The file is sorted in runs of about max_memory bytes which are spilled to temp files and merged lazily.
+    Keys are compared as bytes, which is the code point order for utf-8, the same as "LC_ALL=C sort".
+    The sort is stable, the lines of the same key keep their order in the file.
+    @param path: input file path
+    @param key_idx: the column number of the key, tokenized like iter_file_by_key
+    @param max_memory: the approximate bytes of lines buffered by each process
+    @param tmp_dir: the directory of the temp runs
+    @param workers: generate the runs in a process pool of this size
+    @return: a generator of the raw byte lines, every line ends with b'\n'
+    """
+    bsep = sep.encode(encoding)
+    size = os.path.getsize(path)
+    if is_compressed(path):
+        ranges = [(0, None)]
+    elif workers and workers > 1:
+        ranges = _file_ranges(path, workers)
+        max_memory = max(max_memory // workers, 1)
+    else:
+        ranges = [(0, size)] if size else []
+    tasks = [(path, b, e, key_idx, bsep, max_memory, tmp_dir) for b, e in ranges]
+    runs = []
+    try:
+        if workers and workers > 1 and len(tasks) > 1:
+            pool = multiprocessing.Pool(workers)
+            try:
+                for r in pool.map(_sort_range_runs, tasks):
+                    runs.extend(r)
+            finally:
+                pool.close()
+                pool.join()
         else:
-            new_func = line_func
-        for key, info_list in iter_by_key(f, key_idx=key_idx, func=new_func, filter_func=filter_func):
-            yield (key, info_list)
+            for task in tasks:
+                runs.extend(_sort_range_runs(task))
+        sort_key = _line_sort_key(key_idx, bsep)
+        # merge consecutive runs so that at most MAX_MERGE_RUNS files are open, which keeps the sort stable
+        while len(runs) > MAX_MERGE_RUNS:
+            merged = []
+            for i in range(0, len(runs), MAX_MERGE_RUNS):
+                group = runs[i:i + MAX_MERGE_RUNS]
+                if len(group) == 1:
+                    merged.extend(group)
+                    continue
+                with tempfile.NamedTemporaryFile(dir=tmp_dir, prefix='huosort.', delete=False) as fo:
+                    merged.append(fo.name)
+                    files = [open(run, 'rb') for run in group]
+                    try:
+                        fo.writelines(heapq.merge(*files, key=sort_key))
+                    finally:
+                        for f in files:
+                            f.close()
+                for run in group:
+                    os.remove(run)
+            runs[:] = merged
+        files = [open(run, 'rb') for run in runs]
+        try:
+            # runs are in file order and heapq.merge is stable, so the whole sort is stable
+            for line in heapq.merge(*files, key=sort_key):
+                yield line
+        finally:
+            for f in files:
+                f.close()
+    finally:
+        for run in runs:
+            if os.path.exists(run):
+                os.remove(run)
+
+
+def sort_file_by_key(path, out_path, key_idx=0, sep='\t', encoding='utf-8', max_memory=256 * 1024 * 1024,
+                     tmp_dir=None, workers=None):
+    """
+    Write the lines of a file sorted by a key column, see iter_sorted_lines.
+    @param out_path: the output file path
+    @return: always return None
+    """
+    with open(out_path, 'wb') as fo:
+        fo.writelines(iter_sorted_lines(path, key_idx=key_idx, sep=sep, encoding=encoding, max_memory=max_memory,
+                                        tmp_dir=tmp_dir, workers=workers))
+    return None
+
+
+def iter_file_by_key(path, key_idx=0, encoding='utf-8', sep='\t', func=None, filter_func=None, engine='codecs',
+                     sort=False, max_memory=256 * 1024 * 1024, tmp_dir=None, workers=None):
+    """
+    engine: "codecs" or "binary", see file2dict
+    sort: the input is not sorted by key. It is sorted by iter_sorted_lines first,
+          with max_memory, tmp_dir and workers. The lines are read as the binary engine does.
+    """
+    if sort:
+        lines = iter_sorted_lines(path, key_idx=key_idx, sep=sep, encoding=encoding, max_memory=max_memory,
+                                  tmp_dir=tmp_dir, workers=workers)
+        tokens = _decode_tokens(lines, encoding=encoding, sep=sep)
+    else:
+        tokens = _iter_file_tokens(path, encoding=encoding, sep=sep, engine=engine)
+    for key, info_list in iter_by_key(tokens, key_idx=key_idx, func=func, filter_func=filter_func):
+        yield (key, info_list)
+
+
+def _list_part_files(directory):
+    # hidden and marker files like .part-00000.crc and _SUCCESS are not data
+    names = sorted(n for n in os.listdir(directory) if not n.startswith('.') and not n.startswith('_'))
+    return [os.path.join(directory, n) for n in names]
+
+
+def iter_dir_by_key(directory, key_idx=0, encoding='utf-8', sep='\t', func=None, filter_func=None, engine='codecs'):
+    """
+    Group the lines of many sorted part files by key, like iter_file_by_key on their merge.
+    Every file must be sorted by the key column in code point order, e.g. by "LC_ALL=C sort".
+    @param directory: a directory of part files, or a list of file paths
+    @return: a generator of (key, info_list)
+    """
+    if isinstance(directory, six.string_types):
+        paths = _list_part_files(directory)
+    else:
+        paths = list(directory)
+
+    def sort_key(tokens):
+        # the lines without the key column are dropped by iter_by_key
+        return tokens[key_idx] if len(tokens) > key_idx else u''
+
+    # every part is open at once, a decompression thread and its read-ahead each would not pay off
+    streams = [_iter_file_tokens(p, encoding=encoding, sep=sep, engine=engine, threaded=False) for p in paths]
+    merged = heapq.merge(*streams, key=sort_key)
+    for key, info_list in iter_by_key(merged, key_idx=key_idx, func=func, filter_func=filter_func):
+        yield (key, info_list)
+
+
+_GROUP_REDUCER = None
+
+
+def _init_group_reducer(reducer):
+    global _GROUP_REDUCER
+    _GROUP_REDUCER = reducer
+
+
+def _reduce_groups(groups):
+    return [_GROUP_REDUCER(key, info_list) for key, info_list in groups]
+
+
+def _iter_chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            break
+        yield chunk
+
+
+def _imap_bounded(func, tasks, workers, ordered=True, initializer=None, initargs=()):
+    """
+    Map func over tasks in a process pool of workers. At most workers * 4 tasks are in flight,
+    so a large input is not read ahead into memory like pool.imap alone does.
+    @param ordered: yield the results in the order of tasks, otherwise as soon as they are ready
+    @return: a generator of the results of func
+    """
+    in_flight = threading.Semaphore(workers * 4)
+    stopped = []
+
+    def feed():
+        # run by the task thread of the pool, it waits here until a result is taken
+        for task in tasks:
+            in_flight.acquire()
+            if stopped:
+                break
+            yield task
+
+    pool = _fork_context().Pool(workers, initializer=initializer, initargs=initargs)
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(func, feed()):
+            in_flight.release()
+            yield result
+        pool.close()
+    finally:
+        # unblock the feeder and terminate the pool when the caller stops early
+        stopped.append(True)
+        for _ in range(workers * 4):
+            in_flight.release()
+        pool.terminate()
+        pool.join()
+
+
+_CHUNK_WORKERS = {}
+
+
+def _apply_worker(args):
+    factory, options, method, chunk = args
+    # the worker is built once per process and per options
+    worker = _CHUNK_WORKERS.get((factory, options))
+    if worker is None:
+        worker = _CHUNK_WORKERS[(factory, options)] = factory(**dict(options))
+    func = getattr(worker, method) if method else worker
+    return [func(item) for item in chunk]
+
+
+def _imap_worker(factory, options, iterable, method=None, workers=None, chunk_size=100):
+    """
+    Apply the worker factory(**options), or its method, to every item, by chunks in a process pool.
+    @param factory: a picklable class or function building the worker
+    @param options: a dict of the hashable arguments of factory
+    @param method: the name of the method applied to the items, None means calling the worker
+    @param workers: the process number, None or 1 means in the current process
+    @param chunk_size: the number of items sent to a process at once
+    @return: a generator of the results in the input order, the input is read ahead by workers * 4 chunks at most
+    """
+    tasks = ((factory, tuple(sorted(options.items())), method, chunk) for chunk in _iter_chunks(iterable, chunk_size))
+    if not workers or workers <= 1:
+        for args in tasks:
+            for result in _apply_worker(args):
+                yield result
+        return
+    for results in _imap_bounded(_apply_worker, tasks, workers):
+        for result in results:
+            yield result
+
+
+def parallel_reduce(groups, reducer, workers=None, ordered=True, chunk_size=100):
+    """
+    Apply reducer(key, info_list) to every group in a process pool.
+    The reducer is handed to the workers by fork like parallel_parse, it must be picklable where fork is
+    not available. At most workers * 4 chunks are in flight, so a large input is not read ahead into memory.
+    @param groups: an iterable of (key, info_list), e.g. iter_dir_by_key
+    @param reducer: a function of (key, info_list)
+    @param workers: the process number, None or 1 means in the current process
+    @param ordered: yield the results in the order of groups, otherwise as soon as they are ready
+    @param chunk_size: the number of groups sent to a process at once
+    @return: a generator of the results of reducer
+    """
+    if not workers or workers <= 1:
+        for key, info_list in groups:
+            yield reducer(key, info_list)
+        return
+    chunks = _iter_chunks(groups, chunk_size)
+    for results in _imap_bounded(_reduce_groups, chunks, workers, ordered, _init_group_reducer, (reducer, )):
+        for result in results:
+            yield result
+
+
+def reduce_dir_by_key(directory, reducer, workers=None, ordered=True, chunk_size=100, **kwargs):
+    """
+    Merge the sorted part files of a directory by key and reduce the groups in a process pool.
+    @param kwargs: key_idx, encoding, sep, func, filter_func and engine, see iter_dir_by_key
+    @return: a generator of the results of reducer(key, info_list), see parallel_reduce
+    """
+    groups = iter_dir_by_key(directory, **kwargs)
+    return parallel_reduce(groups, reducer, workers=workers, ordered=ordered, chunk_size=chunk_size)
 
 
 def iter_file_in_dir(directory, encoding='utf-8'):
     for name in os.listdir(directory):
+        # hidden files like the .linenum sidecars of file_line_num are not data
+        if name.startswith('.'):
+            continue
         path = os.path.join(directory, name)
-        with codecs.open(path, encoding=encoding) as f:
+        with open_file(path, encoding=encoding) as f:
             yield f
 
 
@@ -992,31 +2002,41 @@ class MLStripper(HTMLParser):
     """
 
     def __init__(self):
-        self.reset()
+        if six.PY2:
+            HTMLParser.__init__(self)
+        else:
+            # the entities are unescaped before the feed, not twice
+            HTMLParser.__init__(self, convert_charrefs=False)
         self.fed = []
 
     def handle_data(self, d):
+        if self.cdata_elem is not None:
+            # script and style are not unescaped by the parser
+            d = d.replace('&amp;', '&')
         self.fed.append(d)
 
+    def handle_entityref(self, name):
+        # every "&" is escaped as "&amp;" before the feed
+        self.fed.append('&')
+
     def get_data(self):
         return ''.join(self.fed)
 
     def strip_tags(self, html):
         self.reset()
         self.fed = []
-        html = self.unescape(html)
+        html = html_unescape(html).replace('&', '&amp;')
         self.feed(html)
+        self.close()
         return self.get_data()
 
 
 def strip_tags(html):
     """
-    If you need to strip multi times. It is better not to use the function but the class method.
+    If you need to strip multi times. It is better not to use the function but the class method,
+    or htmlstrip.HTMLStripper for large crawls.
     """
-    s = MLStripper()
-    html = s.unescape(html)
-    s.feed(html)
-    return s.get_data()
+    return MLStripper().strip_tags(html)
 
 
 def send_mail_by_mailx(subject, content, user_list, sender=None, html=False):
@@ -1067,11 +2087,12 @@ def update_dict(d, u):
 
 
 def is_all_ascii(s):
-    try:
-        _ = str(s)
-        return True
-    except UnicodeEncodeError:
-        return False
+    """
+    @param s: a string, other objects are checked by their str()
+    """
+    if not isinstance(s, (six.text_type, six.binary_type)):
+        s = str(s)
+    return is_ascii(s)
 
 
 def input_schema_valid(params, schema, validator=Draft7Validator):
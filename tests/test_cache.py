@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+import sys
+import json
+import time
+
+sys.path.insert(0, '.')
+import pytest
+from huoutil.cache import LRUCache, RedisCache
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.stats() == {'hits': 3, 'misses': 1, 'size': 2}
+    cache.delete('a')
+    assert cache.get('a', 'missing') == 'missing'
+
+
+def test_lru_cache_ttl():
+    cache = LRUCache(maxsize=10, ttl=10)
+    cache.set('a', 1, ttl=0.01)
+    cache.set('b', 2)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert cache.get('b') == 2
+    # ttl=0 is already expired
+    cache.set('b', 3, ttl=0)
+    assert cache.get('b') is None and len(cache) == 0
+    with pytest.raises(ValueError):
+        LRUCache(ttl=0)
+
+
+def test_redis_cache_local_cache():
+    fakeredis = pytest.importorskip('fakeredis')
+    cache = RedisCache(backend=fakeredis.FakeStrictRedis())
+    server = cache._cache
+    cache.set_local_cache(maxsize=100, ttl=100)
+    # set_json and set_obj write through, the reads are served locally
+    cache.set_json(('k', 'j'), {'x': [1]})
+    cache.set_obj('o', {1, 2})
+    server.set('k\x01j', '"changed behind"')
+    server.set('o', 'changed behind')
+    assert cache.get_json(['k', 'j']) == {'x': [1]}
+    assert cache.get_obj('o') == {1, 2}
+    assert cache.local_stats() == {'hits': 2, 'misses': 0, 'size': 2}
+    # a miss reads redis and fills the local cache
+    server.set('r', 'v')
+    assert cache.get('r') == b'v'
+    server.set('r', 'w')
+    assert cache.get('r') == b'v'
+    # the other setters and delete invalidate the local entries of every kind
+    cache.set('r', 'x')
+    assert cache.get('r') == b'x'
+    assert cache.delete(('k', 'j'), 'o', 'r') == 3
+    assert cache.get_json(('k', 'j')) is None
+    assert cache.get_obj('o') is None
+    assert cache.get('r') is None
+    # a read during a batch does not put the old value back after the write
+    cache.set('k', 'v1')
+    assert cache.get('k') == b'v1'
+    with cache.batch() as b:
+        b.set('k', 'v2')
+        b.set_json('kj', [2])
+        assert cache.get('k') == b'v1'
+        assert cache.get_json('kj') is None
+    assert cache.get('k') == b'v2'
+    assert cache.get_json('kj') == [2]
+    server.set('kj', '[3]')
+    assert cache.get_json('kj') == [2]
+    cache.mset({'k': 'v3'})
+    assert cache.get('k') == b'v3'
+    # the local entries expire by default
+    cache.set_local_cache()
+    assert cache._local.ttl is not None
+    # expired in redis, so expired locally
+    cache.set_json('short', 1, ex=1)
+    time.sleep(1.1)
+    assert cache.get_json('short') is None
+
+
+def test_codec():
+    import pickle
+    from huoutil.cache import Codec
+    value = {u'名字': [u'值' * 2000, 1, 2.5, None]}
+    default = Codec()
+    assert default.dumps_json(value) == json.dumps(value, ensure_ascii=False)
+    assert default.loads_obj(pickle.dumps(value, protocol=2)) == value
+    codecs = [default, Codec(compress='zlib', compress_threshold=100, pickle_protocol=pickle.HIGHEST_PROTOCOL)]
+    for codec in codecs:
+        for other in codecs:
+            assert other.loads_json(codec.dumps_json(value)) == value
+            assert other.loads_obj(codec.dumps_obj(value)) == value
+    assert codecs[1].dumps_json(value)[:1] == b'\x01'
+    assert codecs[1].dumps_json({'a': 1}) == json.dumps({'a': 1})
+    assert default.dumps_json(None) is None
+    assert default.loads_obj(None) is None
+
+
+@pytest.mark.parametrize('backend', ['memory', 'sqlite://'])
+def test_redis_cache_local_backend(backend):
+    cache = RedisCache(backend=backend)
+    assert cache.get('a') is None
+    assert cache.set('a', u'值') is True
+    assert cache.get('a') == u'值'.encode('utf-8')
+    assert cache.set_json(('k', 'json'), {'x': [1, 2]}) is True
+    assert cache.get_json(['k', 'json']) == {'x': [1, 2]}
+    cache.set_obj('obj', {1, 2})
+    assert cache.get_obj('obj') == {1, 2}
+    assert cache.hset('h', 'f', 'v', ex=100) == (1, True)
+    assert cache.hget('h', 'f') == b'v'
+    assert cache.hmset_json('h', {'a': 1, 'b': [2]}) == (2, None)
+    assert cache.hmget_json('h', ['a', 'b', 'c']) == [1, [2], None]
+    assert cache.mset_json({'m1': 1, 'm2': 'two'}) is True
+    assert cache.mget_json(['m1', 'm2', 'm3']) == [1, 'two', None]
+    with cache.batch() as b:
+        b.set_json('b1', [1])
+        b.get_json('b1')
+        b.hset('h', 'f', 'w')
+    assert b.results == [True, [1], (0, None)]
+    assert cache.delete('a', 'obj', 'none') == 2
+    assert cache.get('a') is None
+
+    cache.set('short', 'v', ex=1)
+    cache.hset('short_hash', 'f', 'v', ex=1)
+    time.sleep(1.1)
+    assert cache.get('short') is None
+    assert cache.hget('short_hash', 'f') is None
+
+
+def test_sqlite_backend_persist(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    cache = RedisCache(backend='sqlite:///' + path, decode_responses=True)
+    cache.set_list('l', ['a', 'b'])
+    cache = RedisCache(backend='sqlite:///' + path, decode_responses=True)
+    assert cache.get_list('l') == ['a', 'b']
+
+
+def test_cached():
+    import threading
+    cache = RedisCache(backend='memory')
+    calls = []
+
+    @cache.cached(ex=100)
+    def slow(x, y=1):
+        calls.append(x)
+        time.sleep(0.2)
+        return None if x == 0 else {'sum': x + y}
+
+    threads = [threading.Thread(target=slow, args=(5, )) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert calls == [5]
+    assert slow(5) == {'sum': 6}
+    assert slow(5, y=2) == {'sum': 7}
+    assert slow(0) is None
+    assert slow(0) is None
+    assert calls == [5, 5, 0]
+    slow.invalidate(5)
+    assert slow(5) == {'sum': 6}
+    assert calls == [5, 5, 0, 5]
+
+
+def test_async_redis_cache(monkeypatch):
+    import asyncio
+    from huoutil import aiocache
+    from huoutil.aiocache import AsyncRedisCache
+    fakeredis = pytest.importorskip('fakeredis')
+
+    async def run():
+        async with AsyncRedisCache(backend=fakeredis.FakeAsyncRedis(decode_responses=True)) as cache:
+            assert await cache.get('a') is None
+            assert await cache.set_json(('k', 'json'), {'x': [1, 2]}) is True
+            assert await cache.get_json(['k', 'json']) == {'x': [1, 2]}
+            assert await cache.set_list('l', ['a', 'b']) is True
+            assert await cache.get_list('l') == ['a', 'b']
+            assert await cache.hset_json('h', 'f', [1], ex=100) == (1, True)
+            assert await cache.hget_json('h', 'f') == [1]
+            assert 0 < await cache._cache.ttl('h') <= 100
+            assert await cache.hset('h', 'g', 'v') == (1, None)
+            assert await cache.delete('h', 'l', 'none') == 2
+            assert await cache.hget('h', 'f') is None
+            assert await cache.get_json(['k', 'json']) == {'x': [1, 2]}
+            assert await cache.delete(('k', 'json')) == 1
+            assert await cache.get_json(['k', 'json']) is None
+
+    asyncio.run(run())
+    monkeypatch.setattr(aiocache, 'aioredis', None)
+    with pytest.raises(ImportError):
+        AsyncRedisCache()
+
+
+def test_redis_cache_pipeline():
+    fakeredis = pytest.importorskip('fakeredis')
+    cache = RedisCache(backend=fakeredis.FakeStrictRedis())
+    assert cache.mset({'a': '1', ('b', 'c'): '2'}) is True
+    assert cache.mget(['b', 'a', 'none', ('b', 'c')]) == [None, b'1', None, b'2']
+    assert cache.mget(['a', 'none'], func=lambda v: v and int(v)) == [1, None]
+    assert cache.mget([]) == []
+    assert cache.mset([('e1', 'x'), ('e2', 'y')], ex=100) is True
+    assert 0 < cache._cache.ttl('e2') <= 100
+    assert cache.mset_json({'j1': {'x': 1}, 'j2': [2]}) is True
+    assert cache.mget_json(['j2', 'none', 'j1']) == [[2], None, {'x': 1}]
+    assert cache.mset_obj({'o': {1, 2}}) is True
+    assert cache.mget_obj(['o', 'none']) == [{1, 2}, None]
+
+    assert cache.hmset('h', {'f1': 'v1', 'f2': 'v2'}, ex=100) == (2, True)
+    assert 0 < cache._cache.ttl('h') <= 100
+    assert cache.hmset('h', {'f2': 'w'}) == (0, None)
+    assert cache.hmget('h', ['f2', 'none', 'f1']) == [b'w', None, b'v1']
+    assert cache.hmget('h', []) == []
+    assert cache.hmset_json('hj', {'a': [1], 'b': 'x'}) == (2, None)
+    assert cache.hmget_json('hj', ['b', 'a', 'c']) == ['x', [1], None]
+
+    for transaction in (False, True):
+        with cache.batch(transaction=transaction) as b:
+            assert b.set_json('b1', [transaction]) is None
+            b.get_json('b1')
+            b.mget(['a', 'none'])
+            b.hset('h', 'f3', 'v', ex=10)
+            b.hget('h', 'f3')
+            b.delete('b1')
+        assert b.results == [True, [transaction], [b'1', None], (int(not transaction), True), b'v', 1]
+    assert cache.get('b1') is None
+    # an error reply is raised when the block exits
+    cache.set('s', 'string')
+    with pytest.raises(Exception):
+        with cache.batch(transaction=True) as b:
+            b.set('t', 'v')
+            b.hget('s', 'f')
+    assert b.results == []
+
+
+def test_cached_lock():
+    from huoutil.backend import MemoryBackend
+
+    class ScriptClient(object):
+        # a redis client whose lua scripts are emulated by the memory backend
+        def __init__(self):
+            self.backend = MemoryBackend()
+            self.scripts = []
+
+        def __getattr__(self, name):
+            if name == 'delete_if_equal':
+                raise AttributeError(name)
+            return getattr(self.backend, name)
+
+        def register_script(self, script):
+            self.scripts.append(script)
+            return lambda keys, args: self.backend.delete_if_equal(keys[0], args[0])
+
+    for backend in ('memory', ScriptClient()):
+        cache = RedisCache(backend=backend)
+        calls = []
+
+        @cache.cached(ex=100)
+        def func(x):
+            calls.append(x)
+            if x == 'steal':
+                # the lock expired and another worker took it
+                cache._cache.set(lock_key, 'other')
+            return x
+
+        lock_key = cache._wrap_key([func.cache_key('steal'), 'lock'])
+        assert func('steal') == 'steal'
+        assert cache._cache.get(lock_key) == b'other'
+        cache._cache.delete(lock_key)
+        assert func('steal') == 'steal'
+        assert calls == ['steal']
+        assert cache._cache.get(lock_key) is None
+
+        # a worker missed just before the lock holder stored the value and released the lock
+        getter = cache.get_json
+        misses = []
+        cache.get_json = lambda k: misses.append(k) if not misses else getter(k)
+
+        @cache.cached(prefix='other')
+        def other(x):
+            calls.append(x)
+            return x
+
+        cache.set_json(other.cache_key(1), [1])
+        assert other(1) == 1
+        assert calls == ['steal'] and len(misses) == 1
+        if backend != 'memory':
+            assert len(backend.scripts) == 1
+
+
+def test_sqlite_backend_nx_race(tmp_path):
+    import threading
+    from huoutil.backend import SqliteBackend
+    path = str(tmp_path / 'cache.db')
+    # one connection per worker, like separate processes
+    backends = [SqliteBackend(path) for _ in range(4)]
+    for i in range(30):
+        barrier = threading.Barrier(len(backends))
+        won = []
+
+        def race(backend):
+            barrier.wait()
+            if backend.set('lock%d' % i, str(id(backend)), nx=True, ex=100):
+                won.append(backend)
+
+        threads = [threading.Thread(target=race, args=(b, )) for b in backends]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(won) == 1
+        assert [b.delete_if_equal('lock%d' % i, str(id(won[0]))) for b in backends] == [1, 0, 0, 0]
+    for b in backends:
+        b.close()
@@ -3,10 +3,11 @@
 
 import os
 import sys
+import time
 
 sys.path.insert(0, '.')
 from huoutil.util import ConfigBase
-from huoutil.util import file2dictlist, file2list, file2set, load_python_conf
+from huoutil.util import file2dictlist, iter_file2dictlist, file2list, file2set, load_python_conf
 from huoutil.uni import standard_string_format
 import pytest
 TESTDATA = './tests/testdata/'
@@ -53,6 +54,106 @@ def test_file2dictlist():
     assert data == set(['子宫平滑肌抑制药', '胰岛素'])
 
 
+def test_file2dictlist_workers():
+    path = os.path.join(TESTDATA, 'test_file2dictlist')
+    for skip_line in (0, 1, 4, 8):
+        assert file2dictlist(path, kn=0, vn=None, skip_line=skip_line, workers=2) == \
+            file2dictlist(path, kn=0, vn=None, skip_line=skip_line)
+        assert file2list(path, n=0, skip_line=skip_line, workers=2) == file2list(path, n=0, skip_line=skip_line)
+
+
+def test_binary_engine():
+    from huoutil.util import file2dict, iter_file_by_key, file_line_num
+    path = os.path.join(TESTDATA, 'test_file2dictlist')
+    for vn in (1, None):
+        assert file2dict(path, kn=0, vn=vn, skip_line=2, engine='binary') == file2dict(path, kn=0, vn=vn, skip_line=2)
+    assert file2list(path, n=0, skip_line=4, engine='binary') == file2list(path, n=0, skip_line=4)
+    assert list(iter_file_by_key(path, engine='binary')) == list(iter_file_by_key(path))
+    assert file_line_num(path, engine='binary') == file_line_num(path)
+    with pytest.raises(ValueError):
+        file2dict(path, engine='mmap')
+
+
+def test_file_line_num(tmp_path):
+    from huoutil.util import file_line_num, iter_dir_by_key, iter_file_in_dir
+    path = str(tmp_path / 'lines')
+    with open(path, 'wb') as f:
+        f.write(u'一\n二\n\n三'.encode('utf-8'))
+    assert file_line_num(path) == 4
+    assert file_line_num(path, engine='codecs') == 4
+    assert file_line_num(path, workers=3) == 4
+    assert file_line_num(path, cache=True) == 4
+    assert sorted(os.listdir(str(tmp_path))) == ['.lines.linenum', 'lines']
+    # the sidecar is not read as data by the directory readers
+    assert [k for k, _ in iter_dir_by_key(str(tmp_path))] == [u'一', u'二', u'', u'三']
+    assert [f.read() for f in iter_file_in_dir(str(tmp_path))] == [u'一\n二\n\n三']
+    assert file_line_num(path, cache=True) == 4
+    with open(path, 'ab') as f:
+        f.write(b'\n4\n')
+    assert file_line_num(path, cache=True) == 5
+
+
+def test_parallel_parse_start_method(tmp_path):
+    import subprocess
+    from huoutil.util import file2dict
+    path = str(tmp_path / 'data.tsv')
+    with open(path, 'wb') as f:
+        f.write(u''.join(u'k%d\tv%d\n' % (i, i) for i in range(100)).encode('utf-16'))
+    with pytest.raises(ValueError):
+        file2dict(path, encoding='utf-16', workers=2)
+    assert len(file2dict(path, encoding='utf-16')) == 100
+    with open(path, 'wb') as f:
+        f.write(b'a\t1\nb\t2\n')
+    # a lambda parser with another default start method
+    code = ('import multiprocessing; multiprocessing.set_start_method("forkserver"); '
+            'from huoutil.util import file2dict; '
+            'print(sorted(file2dict(%r, workers=2, ktype=lambda k: k.upper())))' % path)
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.abspath('.'))
+    assert out.strip() == b"['A', 'B']"
+
+
+def test_iter_file2dictlist():
+    path = os.path.join(TESTDATA, 'test_file2dictlist')
+    for dup in (True, False):
+        data = file2dictlist(path, kn=0, vn=None, dup=dup)
+        for max_memory in (1, 1024 * 1024):
+            items = list(iter_file2dictlist(path, kn=0, vn=None, dup=dup, max_memory=max_memory))
+            assert [k for k, _ in items] == sorted(data)
+            assert dict(items) == data
+
+
+def test_iter_file2dictlist_merge_levels(tmp_path, monkeypatch):
+    import random
+    import tempfile
+    from huoutil import util
+    path = str(tmp_path / 'data.txt')
+    rnd = random.Random(1)
+    with open(path, 'w') as f:
+        for i in range(500):
+            f.write('k%d\tv%d\tw%d\n' % (rnd.randint(0, 80), i, rnd.randint(0, 9)))
+    # count the temp runs open at the same time
+    opened = []
+    temporary_file = tempfile.TemporaryFile
+
+    def counting_file(*args, **kwargs):
+        opened.append(temporary_file(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(tempfile, 'TemporaryFile', counting_file)
+    monkeypatch.setattr(util, 'MAX_MERGE_RUNS', 3)
+    max_open = 0
+    for dup in (True, False):
+        expected = file2dictlist(path, kn=0, vn=None, dup=dup)
+        items = []
+        for item in iter_file2dictlist(path, kn=0, vn=None, dup=dup, max_memory=1):
+            max_open = max(max_open, sum(1 for f in opened if not f.closed))
+            items.append(item)
+        assert [k for k, _ in items] == sorted(expected)
+        assert dict(items) == expected
+        assert all(f.closed for f in opened)
+    assert len(opened) > 500 and max_open <= 3
+
+
 def test_cleandata():
     s = '贫血，头晕？【】［伯格］eN^? Ⅵ腹痛Ⅹ'
     tmp = 'Ⅰ、Ⅱ、Ⅲ、Ⅳ、Ⅴ、Ⅵ、Ⅶ、Ⅷ、Ⅸ、Ⅹ、Ⅺ、Ⅻ'
@@ -63,6 +164,334 @@ def test_cleandata():
     assert clean_s == 'i、ii、iii、iv、v、vi、vii、viii、ix、x、xi、xii'
 
 
+def test_dbc2sbc_and_punctuation():
+    from huoutil.uni import DBC2SBC, remove_chinese_punctuation, remove_english_punctuation
+    assert DBC2SBC(u'\u3000ＡＢｃ１！～中\uff00\uff5f') == u' ABc1!~中\uff00\uff5f'
+    assert remove_chinese_punctuation(u'你好，世界！——“a”') == u'你好世界a'
+    assert remove_english_punctuation(u'a-b, c[d]\\e^f，') == u'ab cdef，'
+    assert DBC2SBC(u'') == remove_chinese_punctuation(u'') == u''
+
+
+def test_charclass():
+    from huoutil.charclass import ascii_mask, chinese_mask, all_chinese_mask, is_ascii
+    from huoutil.util import is_all_ascii
+    from huoutil.uni import english_words
+    strings = [u'abc', u'', u'中文', u'a中b', u'\u3000', b'ab', b'\xff']
+    assert ascii_mask(strings) == [True, True, False, False, False, True, False]
+    assert chinese_mask(strings[:5]) == [False, False, True, True, False]
+    assert all_chinese_mask(strings[:5]) == [False, False, True, False, False]
+    assert is_ascii(u'\x7f') and not is_ascii(u'\x80')
+    assert not is_all_ascii(u'中') and is_all_ascii(123)
+    assert english_words(u' 中a b文 ') == u'a b'
+    np = pytest.importorskip('numpy')
+    mask = ascii_mask(iter(strings), as_numpy=True)
+    assert mask.dtype == np.bool_ and mask.tolist() == ascii_mask(strings)
+
+
+def test_sentence_spans():
+    import io
+    from huoutil.util import splite_sentence, iter_sentence_spans, iter_file_sentences
+    text = u'今天，天气很好。我们去 公园!散步'
+    assert splite_sentence(text) == [[u'今天，', u'天气很好。'], [u'我们去 ', u'公园!'], [u'散步']]
+    spans = list(iter_sentence_spans(text))
+    assert spans == [(0, 0, 0, 3), (0, 1, 3, 8), (1, 0, 8, 12), (1, 1, 12, 15), (2, 0, 15, 17)]
+    for buffer_size in (1, 4, 100):
+        got = list(iter_file_sentences(io.StringIO(text), buffer_size=buffer_size))
+        assert [span[:4] for span in got] == spans
+        assert [span[4] for span in got] == [text[b:e] for _, _, b, e in spans]
+    assert list(iter_sentence_spans(u'a;b,c', long_sep=u',', short_sep=u'')) == [(0, 0, 0, 4), (1, 0, 4, 5)]
+    assert splite_sentence(u'') == []
+    # a long text without separators is scanned in linear time
+    text = u'a' * 1000000
+    assert splite_sentence(text + u'。b') == [[text + u'。'], [u'b']]
+    got = list(iter_file_sentences(io.StringIO(text), buffer_size=1000))
+    assert len(got) == 1 and got[0][2:] == (0, len(text), text)
+
+
+def test_fingerprint(tmp_path):
+    import hashlib
+    from huoutil.fingerprint import fingerprint, fingerprints, column_fingerprints, file_digests
+    path = str(tmp_path / 'data.tsv')
+    with open(path, 'wb') as f:
+        f.write(u'head\n键1\t值1\n\n键2\t值2 \nshort\n键1\t值3\n'.encode('utf-8'))
+    assert fingerprint(u'值1') == fingerprint(u'值1'.encode('utf-8')) != fingerprint(u'值2')
+    assert fingerprints([u'a', u'b'], algorithm='md5') == [fingerprint(u'a', 'md5'), fingerprint(u'b', 'md5')]
+    assert 0 <= fingerprint(u'a') < 2 ** 64
+    assert column_fingerprints(path, n=1, skip_line=1) == fingerprints([u'值1', u'值2', u'值3'])
+    assert column_fingerprints(path, n=0, skip_line=1, workers=2) == fingerprints([u'键1', u'键2', u'short', u'键1'])
+    assert column_fingerprints(path)[0] == fingerprint(u'head')
+    with open(path, 'rb') as f:
+        assert file_digests([path, path], workers=2) == [hashlib.md5(f.read()).hexdigest()] * 2
+    with pytest.raises(ValueError):
+        fingerprint(u'a', algorithm='crc')
+    np = pytest.importorskip('numpy')
+    assert fingerprints([u'a'], as_numpy=True).dtype == np.uint64
+
+
+def test_minhash_index():
+    from huoutil.neardup import MinHashIndex
+    from huoutil.uni import Normalizer
+    index = MinHashIndex(threshold=0.5, normalize=Normalizer(upper=1))
+    assert index.bands * index.rows == index.num_perm
+    assert index.add_if_new(1, u'今天天气很好，我们去公园散步吧') is None
+    assert index.add_if_new(2, u'今天天气很好,我们去公园散步吧!') == 1
+    assert index.add_if_new(3, u'明天要下雨，大家记得带伞出门') is None
+    assert index.add_if_new(4, u'ＡＢＣdefghijk') is None
+    assert [key for key, _ in index.query(u'abcdefghijk')] == [4]
+    index.insert(5, u'今天天气很好，我们去公园散步')
+    assert sorted(key for key, _ in index.query(u'今天天气很好，我们去公园散步吧')) == [1, 5]
+    assert len(index) == 4 and 2 not in index
+    with pytest.raises(ValueError):
+        index.insert(1, u'x')
+
+
+def test_html_stripper():
+    from huoutil.util import strip_tags
+    from huoutil.htmlstrip import HTMLStripper, strip_tags_batch
+    html = (u'<html><head><style>a>b{}</style><script>if (a<b) {"<p>"}</script></head>'
+            u'<body><p class="x">中文&amp;text</p><!-- c --><a title="1>2">&lt;b&gt;</a> tail</body></html>')
+    expected = u'中文&text<b> tail'
+    for engine in ('regex', 'parser'):
+        stripper = HTMLStripper(engine=engine)
+        assert stripper.strip(html) == expected
+        assert stripper.strip(u'<b>x</b>') == u'x'
+        for size in (1, 7, 1000):
+            chunks = [html[i:i + size] for i in range(0, len(html), size)]
+            assert u''.join(stripper.iter_strip(chunks)) == expected
+        assert u'a>b{}' in HTMLStripper(drop_script_style=False, engine=engine).strip(html)
+    assert list(strip_tags_batch([html, u'<i>y</i>'] * 3, workers=2, chunk_size=1)) == [expected, u'y'] * 3
+    assert strip_tags(u'<b>a&amp;b</b> tail') == u'a&b tail'
+    assert strip_tags(u'<b>a&amp;lt;b</b> AT&T') == u'a&lt;b AT&T'
+    # a stray tag holds back the text, which is not scanned again on each feed
+    text = u'x' * 2000000
+    chunks = [u'a <b'] + [text[i:i + 1000] for i in range(0, len(text), 1000)] + [u' c> d']
+    assert u''.join(HTMLStripper().iter_strip(chunks)) == u'a  d'
+    assert u''.join(HTMLStripper().iter_strip(chunks[:-1])) == u'a <b' + text
+    with pytest.raises(ValueError):
+        HTMLStripper(engine='lxml')
+    with pytest.raises(ValueError):
+        strip_tags_batch([html], engine='lxml')
+
+
+def test_iter_xml2list(tmp_path):
+    import xml.etree.ElementTree as ET
+    from huoutil.util import xml2list, iter_xml2list, iter_file_xml2list
+    xml = (u'<para><sent><subsent>甲</subsent><x><subsent>deep</subsent></x></sent>'
+           u'<subsent>top</subsent><sent><subsent/><subsent>c<b>d</b></subsent></sent></para>')
+    assert list(iter_xml2list(xml)) == xml2list(xml) == [u'甲', u'None', u'c']
+    path = str(tmp_path / 'a.xml')
+    with open(path, 'wb') as f:
+        f.write(xml.encode('utf-8'))
+    assert list(iter_file_xml2list(path)) == xml2list(xml)
+    with open(path, 'rb') as f:
+        assert list(iter_file_xml2list(f)) == xml2list(xml)
+    with pytest.raises(ET.ParseError):
+        list(iter_xml2list(u'<a><b><subsent>x</subsent></b><c>'))
+
+
+def test_reduce_dir_by_key(tmp_path):
+    from huoutil.util import iter_dir_by_key, reduce_dir_by_key, parallel_reduce
+    parts = [[u'a\t1', u'c\t3', u'c\t4'], [u'b\t2', u'c\t5', u'd\t6'], []]
+    for i, lines in enumerate(parts):
+        (tmp_path / ('part-%05d' % i)).write_bytes(u''.join(l + u'\n' for l in lines).encode('utf-8'))
+    (tmp_path / '_SUCCESS').write_bytes(b'')
+    expected = [(u'a', [[u'1']]), (u'b', [[u'2']]), (u'c', [[u'3'], [u'4'], [u'5']]), (u'd', [[u'6']])]
+    assert list(iter_dir_by_key(str(tmp_path))) == expected
+    assert list(iter_dir_by_key(sorted(str(p) for p in tmp_path.glob('part-*')), engine='binary')) == expected
+
+    def reducer(key, info_list):
+        return key, sum(int(info[0]) for info in info_list)
+
+    sums = [(u'a', 1), (u'b', 2), (u'c', 12), (u'd', 6)]
+    assert list(reduce_dir_by_key(str(tmp_path), reducer)) == sums
+    assert list(reduce_dir_by_key(str(tmp_path), reducer, workers=2, chunk_size=1)) == sums
+    assert sorted(reduce_dir_by_key(str(tmp_path), reducer, workers=2, ordered=False)) == sums
+    assert list(parallel_reduce(iter([]), reducer, workers=2)) == []
+
+
+def test_external_sort_by_key(tmp_path, monkeypatch):
+    from huoutil import util
+    from huoutil.util import iter_file_by_key, iter_sorted_lines, sort_file_by_key
+    path = str(tmp_path / 'in')
+    lines = [u'b\t1', u'中\t2', u'a\t3', u'b\t4', u'a\t5', u'c\t6', u'b\t7']
+    with open(path, 'wb') as f:
+        f.write(u'\n'.join(lines).encode('utf-8'))
+    expected = [u'a\t3\n', u'a\t5\n', u'b\t1\n', u'b\t4\n', u'b\t7\n', u'c\t6\n', u'中\t2\n']
+    for workers in (None, 2):
+        got = iter_sorted_lines(path, max_memory=20, tmp_dir=str(tmp_path), workers=workers)
+        assert [line.decode('utf-8') for line in got] == expected
+    assert os.listdir(str(tmp_path)) == ['in']
+    groups = list(iter_file_by_key(path, sort=True, max_memory=20))
+    assert groups == [(u'a', [[u'3'], [u'5']]), (u'b', [[u'1'], [u'4'], [u'7']]), (u'c', [[u'6']]),
+                      (u'中', [[u'2']])]
+    out = str(tmp_path / 'out')
+    sort_file_by_key(path, out, key_idx=1)
+    with open(out, 'rb') as f:
+        assert f.read().decode('utf-8') == u''.join(l + u'\n' for l in lines)
+    # merged by groups of runs, the sort stays stable
+    monkeypatch.setattr(util, 'MAX_MERGE_RUNS', 2)
+    for workers in (None, 2):
+        got = iter_sorted_lines(path, max_memory=1, tmp_dir=str(tmp_path), workers=workers)
+        assert [line.decode('utf-8') for line in got] == expected
+    assert sorted(os.listdir(str(tmp_path))) == ['in', 'out']
+
+
+def test_iter_file_by_key_decode_error(tmp_path):
+    from huoutil.util import iter_file_by_key, iter_dir_by_key
+    path = str(tmp_path / 'part-00000')
+    with open(path, 'wb') as f:
+        f.write(u'a\t1\nb\t\xff\nc\t3\n'.encode('latin-1'))
+    for kwargs in (dict(engine='codecs'), dict(engine='binary'), dict(sort=True)):
+        with pytest.raises(UnicodeDecodeError):
+            list(iter_file_by_key(path, **kwargs))
+    with pytest.raises(UnicodeDecodeError):
+        list(iter_dir_by_key(str(tmp_path), engine='binary'))
+    assert [k for k, _ in iter_file_by_key(path, encoding='latin-1', engine='binary')] == [u'a', u'b', u'c']
+
+
+def test_iter_by_key_modes():
+    from huoutil.util import iter_by_key
+    rows = [[u'a', u'1'], [u'a', u'2'], [], [u'b', u'x'], [u'c', u'3', u'4']]
+    errors = {}
+    groups = list(iter_by_key(rows, func=lambda r: [r[0], int(r[1])] + r[2:], errors=errors))
+    assert groups == [(u'a', [[1], [2]]), (u'c', [[3, u'4']])]
+    assert errors == {'func': 2}
+    errors = {}
+    assert list(iter_by_key(rows, raw=True, errors=errors)) == [(u'a', rows[:2]), (u'b', [rows[3]]), (u'c', [rows[4]])]
+    assert errors == {'key': 1}
+    assert list(iter_by_key([(1, u'k', 2), (3, u'k', 4)], key_idx=1)) == [(u'k', [(1, 2), (3, 4)])]
+
+
+@pytest.mark.parametrize('ext', ['gz', 'bz2', 'xz', 'zst'])
+def test_compressed_files(tmp_path, ext):
+    from huoutil.util import file2dict, file2list, iter_file_by_key, file_line_num, file2dictlist
+    from huoutil.compress import open_file, detect_compression
+    if ext == 'zst':
+        pytest.importorskip('zstandard')
+    text = u'键1\t值1\n键2\t值2\n键2\t值3\n\n键3\t值4'
+    plain = str(tmp_path / 'plain.txt')
+    with open(plain, 'wb') as f:
+        f.write(text.encode('utf-8'))
+    path = str(tmp_path / ('data.' + ext))
+    with open_file(path, 'w') as f:
+        f.write(text)
+    # the format is detected by the magic bytes, not by the name
+    os.rename(path, path + '.data')
+    path += '.data'
+    assert detect_compression(path) is not None and detect_compression(plain) is None
+    for engine in ('codecs', 'binary'):
+        assert file2dict(path, engine=engine, workers=2) == file2dict(plain)
+        assert file2list(path, n=1, engine=engine) == file2list(plain, n=1)
+        assert list(iter_file_by_key(path, engine=engine)) == list(iter_file_by_key(plain))
+        assert file_line_num(path, engine=engine) == file_line_num(plain, engine=engine)
+    assert file2dictlist(path, workers=2) == file2dictlist(plain)
+    with open_file(path, 'rb') as f:
+        assert f.read(3) == u'键'.encode('utf-8')
+
+
+def test_detect_compression(tmp_path):
+    import bz2
+    from huoutil.util import file2dict
+    from huoutil.compress import detect_compression
+    path = str(tmp_path / 'data')
+    with open(path, 'wb') as f:
+        f.write(b'BZh\t1\nx\t2\n')
+    assert detect_compression(path) is None
+    assert file2dict(path) == {u'BZh': u'1', u'x': u'2'}
+    for data in (b'', b'BZh\t1\n'):
+        with open(path, 'wb') as f:
+            f.write(bz2.compress(data))
+        assert detect_compression(path) == 'bz2'
+
+
+def test_unclosed_compressed_reader(tmp_path):
+    import gc
+    import subprocess
+    import threading
+    from huoutil.compress import open_file
+    path = str(tmp_path / 'data.gz')
+    with open_file(path, 'w') as f:
+        f.write(u''.join(u'k%d\tv\n' % (i // 3) for i in range(300000)))
+    f = open_file(path)
+    f.readline()
+    del f
+    gc.collect()
+    assert threading.active_count() == 1
+    # a suspended generator at exit must not abort the interpreter
+    code = 'from huoutil.util import iter_file_by_key; g = iter_file_by_key(%r); print(next(g)[0])' % path
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=os.path.abspath('.'))
+    assert out.strip() == b'k0'
+
+
+def test_writers(tmp_path):
+    from huoutil.util import dict2file, ddict2file, set2file, file2dict, file2ddict, file2list
+    d = dict((u'键%d' % i, i) for i in range(25))
+    for name in ('dict.txt', 'dict.txt.gz'):
+        path = str(tmp_path / name)
+        dict2file(d, path, sep=u'{}', vfunc=lambda v: v * 2, sort_keys=True, atomic=True, batch_size=7)
+        assert file2list(path, n=0, sep=u'{}') == sorted(d)
+        assert file2dict(path, sep=u'{}', vtype=int) == dict((k, v * 2) for k, v in d.items())
+    dd = {u'a': {u'x': u'1', u'y': u'2'}, u'b': {u'z': u'3'}}
+    path = str(tmp_path / 'ddict.txt')
+    ddict2file(dd, path, sort_keys=True, batch_size=2)
+    assert file2ddict(path) == dd
+    with open(path, 'rb') as f:
+        assert f.read() == b'a\tx\t1\na\ty\t2\nb\tz\t3\n'
+    path = str(tmp_path / 'set.txt')
+    set2file(set([3, 1, 2]), path, func=str, sort_keys=True, atomic=True)
+    assert file2list(path) == [u'1', u'2', u'3']
+    # a failed atomic write keeps the old file and removes the temp file
+    with pytest.raises(ZeroDivisionError):
+        set2file([1, 0], path, func=lambda v: 1 // v, atomic=True, batch_size=1)
+    assert file2list(path) == [u'1', u'2', u'3']
+    assert sorted(os.listdir(str(tmp_path))) == ['ddict.txt', 'dict.txt', 'dict.txt.gz', 'set.txt']
+    # a BOM is written once per file, not once per batch
+    for encoding in ('utf-16', 'utf-8-sig'):
+        path = str(tmp_path / ('bom.' + encoding))
+        set2file([u'a', u'b', u'c'], path, encoding=encoding, sort_keys=True, batch_size=1)
+        with open(path, 'rb') as f:
+            assert f.read().decode(encoding) == u'a\nb\nc\n'
+        dict2file({u'k1': 1, u'k2': 2, u'k3': 3}, path, encoding=encoding, sort_keys=True, atomic=True, batch_size=2)
+        assert file2dict(path, encoding=encoding) == {u'k1': u'1', u'k2': u'2', u'k3': u'3'}
+
+
+def test_normalizer():
+    import itertools
+    from huoutil.uni import Normalizer
+    strings = ['贫血，头晕？【】［伯格］eN^? Ⅵ腹痛Ⅹ', 'Ⅰ、Ⅱ、ⅻ､', '＾？ ^\x7f?　ａＢ￥《》', 'ΑΣ Β', '']
+    names = ['ds', 'no_roman', 'en_punc', 'no_space', 'no_abnormal', 'upper', 'lower']
+    for flags in itertools.product([0, 1], repeat=len(names)):
+        kwargs = dict(zip(names, flags))
+        normalizer = Normalizer(**kwargs)
+        for s in strings:
+            assert normalizer(s) == standard_string_format(s, **kwargs)
+
+
+def test_batch_standard_string_format(tmp_path):
+    from huoutil.uni import batch_standard_string_format
+    strings = [u'贫血，头晕？【】［伯格］eN^? Ⅵ腹痛Ⅹ%d' % i for i in range(50)]
+    expected = [standard_string_format(s, upper=1) for s in strings]
+    assert list(batch_standard_string_format(strings, chunk_size=7, upper=1)) == expected
+    assert list(batch_standard_string_format(iter(strings), workers=2, chunk_size=7, upper=1)) == expected
+    path = str(tmp_path / 'strings')
+    with open(path, 'wb') as f:
+        f.write(u'\n'.join(strings).encode('utf-8'))
+    assert list(batch_standard_string_format(path, workers=2, chunk_size=7, upper=1)) == expected
+    # the input is not read ahead beyond the chunks in flight
+    pulled = []
+
+    def generate():
+        for i in range(100000):
+            pulled.append(i)
+            yield u'ａ%d' % i
+
+    results = batch_standard_string_format(generate(), workers=2, chunk_size=10, upper=1)
+    assert next(results) == u'A0'
+    time.sleep(0.5)
+    assert len(pulled) <= (2 * 4 + 2) * 10
+    results.close()
+
+
 def test_load_python_conf():
     conf_path = os.path.join(TESTDATA, 'test_python.conf')
     newconfig = load_python_conf(conf_path, default_property=True)
@@ -75,3 +504,42 @@ def test_load_python_conf():
     newconfig = load_python_conf(conf_path, default_property=False)
     with pytest.raises(AttributeError):
         assert newconfig.sd23sdfsd == None
+
+
+def test_mmap_dict(tmp_path, monkeypatch):
+    from multiprocessing.pool import ThreadPool
+    from huoutil import mmapdict
+    from huoutil.mmapdict import MmapDict
+    from huoutil.util import file2dict
+    path = os.path.join(TESTDATA, 'test_file2dictlist')
+    index_path = str(tmp_path / 'test_file2dictlist.idx')
+    for vn in (1, None):
+        data = MmapDict(path, kn=0, vn=vn, index_path=index_path)
+        assert dict(data.items()) == file2dict(path, kn=0, vn=vn)
+        assert len(data) == len(file2dict(path, kn=0, vn=vn))
+    assert data[u'胰岛素'] == [u'呕吐', u'子宫收缩']
+    assert data[u'泻药'] == []
+    assert u'利尿药' in data
+    assert data.get(u'不存在') is None
+    # the index is rebuilt when ktype changes
+    path = str(tmp_path / 'keys.txt')
+    with open(path, 'wb') as f:
+        f.write(b'ABC\t1\nDef\t2\n')
+    assert u'ABC' in MmapDict(path)
+    data = MmapDict(path, ktype=str.lower)
+    assert dict(data.items()) == {u'abc': u'1', u'def': u'2'}
+    assert u'abc' in data and u'ABC' not in data
+    # the processes opening a stale index at the same time build it once
+    build_mmap_index = mmapdict.build_mmap_index
+    builds = []
+
+    def slow_build(*args, **kwargs):
+        builds.append(args)
+        time.sleep(0.2)
+        return build_mmap_index(*args, **kwargs)
+
+    monkeypatch.setattr(mmapdict, 'build_mmap_index', slow_build)
+    with ThreadPool(4) as pool:
+        dicts = pool.map(lambda _: MmapDict(path, ktype=str.upper), range(4))
+    assert len(builds) == 1
+    assert [sorted(d.keys()) for d in dicts] == [[u'ABC', u'DEF']] * 4